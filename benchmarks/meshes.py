@@ -0,0 +1,106 @@
+# Synthetic meshes for the benchmarks.
+#
+# Each generator takes an approximate vertex count and returns a mesh_arrays.ArrayMesh
+# with points and face arrays, plus a seam edge on the X=0 plane of symmetry for the
+# topological symmetry benchmark.  All of these meshes are symmetric across X=0.
+import math
+import numpy as np
+from zMayaTools import mesh_arrays
+
+def make_grid(vertex_count):
+    """
+    A flat square grid of quads in the XZ plane, from -1 to 1.
+    """
+    # Use an odd number of columns, so there's a column of vertices on the seam.
+    side = max(3, int(round(math.sqrt(vertex_count))) | 1)
+    coords = np.linspace(-1, 1, side)
+    x, z = np.meshgrid(coords, coords)
+    points = np.stack([x.ravel(), np.zeros(side*side), z.ravel()], axis=1)
+
+    # Vertex (row, col) is row*side + col.
+    rows, cols = np.meshgrid(np.arange(side - 1), np.arange(side - 1), indexing='ij')
+    corner = (rows * side + cols).ravel()
+    face_connects = np.stack([corner, corner + side, corner + side + 1, corner + 1], axis=1).ravel()
+    face_counts = np.full(len(corner), 4)
+
+    mid = side // 2
+    seam_edge = (mid, mid + side)
+    return mesh_arrays.ArrayMesh(points, face_counts=face_counts, face_connects=face_connects), seam_edge
+
+def make_sphere(vertex_count):
+    """
+    A UV sphere with quads between rings and triangle fans at the poles.
+    """
+    points, face_counts, face_connects, seam_edge = _make_sphere_arrays(vertex_count)
+    return mesh_arrays.ArrayMesh(points, face_counts=face_counts, face_connects=face_connects), seam_edge
+
+def make_body(vertex_count, seed=0):
+    """
+    A sphere stretched into a body-like shape, with random bumps mirrored across X=0.
+
+    This gives an uneven point distribution like a scanned or sculpted character, rather
+    than the regular spacing of the grid and sphere.
+    """
+    points, face_counts, face_connects, seam_edge = _make_sphere_arrays(vertex_count)
+    points *= (0.6, 1.5, 0.4)
+
+    # Sum a few random waves of |x|, so the bumps on both sides match.
+    rng = np.random.RandomState(seed)
+    mirrored = points.copy()
+    mirrored[:,0] = np.abs(mirrored[:,0])
+    offset = np.zeros(len(points))
+    for _ in range(8):
+        direction = rng.normal(size=3)
+        frequency = rng.uniform(2, 12)
+        phase = rng.uniform(0, 2*math.pi)
+        offset += np.sin(np.dot(mirrored, direction) * frequency + phase) / frequency
+
+    length = np.sqrt(np.einsum('ij,ij->i', points, points))
+    normal = points / np.maximum(length, 1e-12)[:,np.newaxis]
+    points += normal * (offset * 0.05)[:,np.newaxis]
+    return mesh_arrays.ArrayMesh(points, face_counts=face_counts, face_connects=face_connects), seam_edge
+
+def _make_sphere_arrays(vertex_count):
+    # Vertices are the two poles plus (rings-1) rings of 2*rings vertices.  Use a multiple of
+    # four segments, so there are meridians on the seam.
+    rings = max(2, int(round(math.sqrt(vertex_count / 2.0))))
+    segments = max(4, (rings * 2 + 3) // 4 * 4)
+
+    theta = np.pi * np.arange(1, rings) / rings
+    phi = 2 * np.pi * np.arange(segments) / segments
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+
+    # Put phi = 0 at X=0, so mirroring phi gives the mirrored vertex.
+    ring_points = np.stack([
+        np.sin(theta) * np.sin(phi),
+        np.cos(theta),
+        np.sin(theta) * np.cos(phi),
+    ], axis=-1).reshape(-1, 3)
+    points = np.concatenate([[(0, 1, 0)], ring_points, [(0, -1, 0)]])
+    bottom = len(points) - 1
+
+    # Ring vertex (ring, segment) is 1 + ring*segments + segment.
+    seg = np.arange(segments)
+    next_seg = (seg + 1) % segments
+    top_fan = np.stack([np.zeros(segments, dtype=int), 1 + next_seg, 1 + seg], axis=1)
+
+    ring_idx, seg_idx = np.meshgrid(np.arange(rings - 2), seg, indexing='ij')
+    a = 1 + ring_idx * segments + seg_idx
+    b = 1 + ring_idx * segments + (seg_idx + 1) % segments
+    quads = np.stack([a, b, b + segments, a + segments], axis=-1).reshape(-1, 4)
+
+    last_ring = 1 + (rings - 2) * segments
+    bottom_fan = np.stack([np.full(segments, bottom), last_ring + seg, last_ring + next_seg], axis=1)
+
+    face_counts = np.concatenate([np.full(segments, 3), np.full(len(quads), 4), np.full(segments, 3)])
+    face_connects = np.concatenate([top_fan.ravel(), quads.ravel(), bottom_fan.ravel()])
+
+    # The top pole to the first vertex of the first ring is on the seam.
+    seam_edge = (0, 1)
+    return points, face_counts, face_connects, seam_edge
+
+generators = {
+    'grid': make_grid,
+    'sphere': make_sphere,
+    'body': make_body,
+}
@@ -0,0 +1,510 @@
+# Benchmarks for spatial indexing, vertex mapping and RBF solving.
+#
+# This runs under plain CPython with NumPy, without Maya.  If Maya isn't available, the
+# stub maya package in stubs/ is used so zMayaTools modules can be imported.  Meshes are
+# generated by meshes.py and given to zMayaTools as mesh_arrays.ArrayMesh adapters.
+#
+# Results are written as JSON, so runs can be saved and compared:
+#
+# python benchmarks/run_benchmarks.py --output before.json
+# python benchmarks/run_benchmarks.py --output after.json --compare before.json
+#
+# Use --sizes, --meshes and --filter to run a subset.
+from __future__ import print_function
+
+import argparse, datetime, gc, json, math, multiprocessing, os, platform, re, subprocess, sys, timeit
+
+_base_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_base_path, '..', 'scripts'))
+sys.path.insert(0, _base_path)
+
+try:
+    import maya
+except ImportError:
+    sys.path.insert(0, os.path.join(_base_path, 'stubs'))
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 doesn't have tracemalloc, so peak memory isn't recorded.
+    tracemalloc = None
+
+import numpy as np
+from zMayaTools import array_kdtree, kdtree, mesh_arrays, vertex_mapping
+from zMayaTools.rbf import rbf
+import meshes
+
+# The format of the JSON output.  Increase this if it changes incompatibly.
+_results_version = 1
+
+class Case(object):
+    """
+    A generated mesh and the data derived from it that benchmarks share.
+    """
+    def __init__(self, mesh_type, size, query_count, seed=0):
+        self.mesh_type = mesh_type
+        self.size = size
+        self.mesh, self.seam_edge = meshes.generators[mesh_type](size)
+        self.points = mesh_arrays.get_world_points(self.mesh)
+        self.rng = np.random.RandomState(seed)
+
+        # Estimate the spacing between neighboring vertices from a sample of them, to scale
+        # thresholds and radii to the mesh.
+        tree = array_kdtree.KDTree(self.points)
+        sample = self.points[self.rng.choice(len(self.points), min(len(self.points), 1000), replace=False)]
+        indices, distances = tree.query(sample, k=2)
+        self.spacing = float(np.sqrt(np.median(distances[:,1])))
+        self.tree = tree
+
+        # Query near vertices, not exactly on them.
+        query_indices = self.rng.choice(len(self.points), min(len(self.points), query_count), replace=False)
+        self.queries = self.points[query_indices] + self.rng.normal(scale=self.spacing * 0.1, size=(len(query_indices), 3))
+
+        # Symmetric vertices should be found within a fraction of the spacing.  Thresholds
+        # are squared.
+        self.threshold = (self.spacing * 0.25) ** 2
+
+        self._shuffled_mesh = None
+        self._coarse_mesh = None
+
+    @property
+    def vertex_count(self):
+        return len(self.points)
+
+    @property
+    def shuffled_mesh(self):
+        """
+        A copy of the mesh with its vertices reordered and moved slightly, as if it had been
+        exported and imported again.  Every vertex has a match in the original.
+        """
+        if self._shuffled_mesh is None:
+            order = self.rng.permutation(len(self.points))
+            points = self.points[order] + self.rng.normal(scale=self.spacing * 0.01, size=self.points.shape)
+            self._shuffled_mesh = mesh_arrays.ArrayMesh(points)
+        return self._shuffled_mesh
+
+    @property
+    def coarse_mesh(self):
+        """
+        The same shape with about half as many vertices, and different topology.
+        """
+        if self._coarse_mesh is None:
+            self._coarse_mesh = meshes.generators[self.mesh_type](max(self.size // 2, 16))[0]
+        return self._coarse_mesh
+
+# Each benchmark takes a Case and returns a function to time.  Setup that shouldn't be timed
+# is done before returning it.  It can also return (run, describe), where describe takes the
+# result of run and returns a dictionary of details to include in the results, such as
+# result counts to check that a change didn't break anything.
+#
+# max_vertices skips the benchmark on larger meshes.  If it's a string, it's the name of
+# an option giving the limit.
+benchmarks = []
+
+def benchmark(name, max_vertices=None):
+    def wrapper(func):
+        benchmarks.append((name, func, max_vertices))
+        return func
+    return wrapper
+
+@benchmark('kdtree.build')
+def _kdtree_build(case):
+    return lambda: array_kdtree.KDTree(case.points)
+
+@benchmark('kdtree.nn')
+def _kdtree_nn(case):
+    run = lambda: case.tree.query(case.queries)
+    describe = lambda result: {'queries': len(case.queries)}
+    return run, describe
+
+@benchmark('kdtree.knn')
+def _kdtree_knn(case):
+    run = lambda: case.tree.query(case.queries, k=8)
+    describe = lambda result: {'queries': len(case.queries), 'k': 8}
+    return run, describe
+
+@benchmark('kdtree.radius')
+def _kdtree_radius(case):
+    radius = case.spacing * 2
+    run = lambda: case.tree.query_radius(case.queries, radius)
+    describe = lambda result: {'queries': len(case.queries), 'neighbors': int(len(result[1]))}
+    return run, describe
+
+@benchmark('kdtree.save_load')
+def _kdtree_save_load(case):
+    import shutil, tempfile
+
+    def run():
+        path = tempfile.mkdtemp()
+        try:
+            case.tree.save(path)
+            array_kdtree.KDTree.load(path, mmap=False)
+        finally:
+            shutil.rmtree(path)
+    return run
+
+# The pure Python kd-tree is much slower, so it's only run on smaller meshes, and only a
+# sample of queries is searched.
+_python_query_count = 1000
+
+@benchmark('python_kdtree.build', max_vertices='max_python_vertices')
+def _python_kdtree_build(case):
+    point_list = [tuple(p) for p in case.points.tolist()]
+    return lambda: kdtree.create(point_list, dimensions=3)
+
+@benchmark('python_kdtree.nn', max_vertices='max_python_vertices')
+def _python_kdtree_nn(case):
+    tree = kdtree.create([tuple(p) for p in case.points.tolist()], dimensions=3)
+    queries = [tuple(p) for p in case.queries[:_python_query_count].tolist()]
+    run = lambda: [tree.search_nn(point) for point in queries]
+    describe = lambda result: {'queries': len(queries)}
+    return run, describe
+
+@benchmark('python_kdtree.knn', max_vertices='max_python_vertices')
+def _python_kdtree_knn(case):
+    tree = kdtree.create([tuple(p) for p in case.points.tolist()], dimensions=3)
+    queries = [tuple(p) for p in case.queries[:_python_query_count].tolist()]
+    run = lambda: [tree.search_knn(point, 8) for point in queries]
+    describe = lambda result: {'queries': len(queries), 'k': 8}
+    return run, describe
+
+# Opt-in benchmarks are slow stress tests that make their own points instead of using the
+# generated meshes.  They're only run when --filter matches them, and only once, not for
+# each mesh and size.  Each takes the number of points to make.
+opt_in_benchmarks = []
+
+def opt_in_benchmark(name, size):
+    def wrapper(func):
+        opt_in_benchmarks.append((name, func, size))
+        return func
+    return wrapper
+
+@opt_in_benchmark('python_kdtree.planar_1m', size=1000000)
+def _python_kdtree_planar(size):
+    # Points on the Z=0 plane, in a randomly jittered grid.  Every point has the same Z, so
+    # this used to make very deep trees that overflowed the stack when searched.
+    rng = np.random.RandomState(0)
+    side = int(math.sqrt(size))
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    points = np.stack([x.ravel(), y.ravel(), np.zeros(side*side)], axis=1)
+    points[:,:2] += rng.uniform(-0.25, 0.25, size=(len(points), 2))
+    point_list = [tuple(p) for p in points.tolist()]
+
+    queries = points[rng.choice(len(points), _python_query_count, replace=False)] + rng.normal(scale=0.5, size=(_python_query_count, 3))
+    removed = rng.choice(len(points), _python_query_count, replace=False)
+
+    # A smaller set of points in random order, to add to an empty tree one at a time.
+    added = rng.permutation(len(points))[:size // 10]
+
+    def check_nn(tree, remaining):
+        # Compare against the array kd-tree.  Check distances rather than indices, in case
+        # of ties.  Return the average number of nodes visited by each search.
+        expected = array_kdtree.KDTree(points[remaining]).query(queries)[1]
+        stats = {}
+        visited = 0
+        for query, expected_distance in zip(queries.tolist(), expected.tolist()):
+            node, distance = tree.search_nn(tuple(query), stats=stats)
+            assert abs(distance - expected_distance) <= 1e-9, (query, distance, expected_distance)
+            visited += stats['visited_nodes']
+        return visited / float(len(queries))
+
+    def describe(tree):
+        # create() splits at the median, so the tree is as shallow as possible.
+        height = tree.height()
+        assert height <= int(math.ceil(math.log(len(points) + 1, 2))), height
+        visited = check_nn(tree, np.arange(len(points)))
+
+        # Removing points rebuilds subtrees that are too unbalanced, which limits the height.
+        for idx in removed:
+            tree = tree.remove(point_list[idx])
+        height_after_remove = tree.height()
+        max_height = math.log(len(points)) / math.log(1 / kdtree.KDNode.balance_factor) + 2
+        assert height_after_remove <= max_height, height_after_remove
+
+        # Searches shouldn't get much slower after removing a few points.
+        visited_after_remove = check_nn(tree, np.setdiff1d(np.arange(len(points)), removed))
+        assert visited_after_remove <= visited * 1.1, (visited, visited_after_remove)
+
+        # Adding points to an empty tree creates nodes that split on Z, until add() rebuilds
+        # them.  Rebuilt subtrees should search about as well as ones made by create().
+        del tree
+        added_tree = kdtree.create(dimensions=3)
+        for idx in added:
+            added_tree.add(point_list[idx])
+        visited_added = check_nn(added_tree, added)
+        visited_created = check_nn(kdtree.create([point_list[idx] for idx in added], dimensions=3), added)
+        assert visited_added <= visited_created * 1.25, (visited_created, visited_added)
+
+        return {'points': len(points), 'height': height, 'removed': len(removed), 'height_after_remove': height_after_remove,
+                'visited_nodes': round(visited, 1), 'visited_nodes_after_remove': round(visited_after_remove, 1),
+                'added': len(added), 'visited_nodes_added': round(visited_added, 1)}
+
+    return lambda: kdtree.create(point_list, dimensions=3), describe
+
+def _describe_symmetry(result):
+    vertex_array, unmapped = result
+    return {'mapped': int((vertex_array != -1).sum()), 'unmapped': len(unmapped)}
+
+@benchmark('symmetry.kdtree')
+def _symmetry_kdtree(case):
+    run = lambda: vertex_mapping.make_vertex_symmetry_array(case.mesh, threshold=case.threshold, method='kdtree', use_cache=False)
+    return run, _describe_symmetry
+
+@benchmark('symmetry.grid')
+def _symmetry_grid(case):
+    run = lambda: vertex_mapping.make_vertex_symmetry_array(case.mesh, threshold=case.threshold, method='grid', use_cache=False)
+    return run, _describe_symmetry
+
+@benchmark('symmetry.three_planes')
+def _symmetry_three_planes(case):
+    run = lambda: vertex_mapping.make_vertex_symmetry_arrays(case.mesh, axes=('x', 'y', 'z'), threshold=case.threshold, use_cache=False)
+    return run, lambda result: _describe_symmetry(result[0])
+
+@benchmark('symmetry.cached')
+def _symmetry_cached(case):
+    # Time a cache hit for a mesh that isn't a scene node, which hashes the mesh to find it.
+    cache = vertex_mapping.symmetry_map_cache
+    cache.clear()
+    vertex_mapping.make_vertex_symmetry_array(case.mesh, threshold=case.threshold)
+    run = lambda: vertex_mapping.make_vertex_symmetry_array(case.mesh, threshold=case.threshold)
+    return run, _describe_symmetry
+
+@benchmark('symmetry.topological')
+def _symmetry_topological(case):
+    run = lambda: vertex_mapping.make_topological_vertex_symmetry_map(case.mesh, seam_edge=case.seam_edge)
+    describe = lambda result: {'mapped': len(result[0]), 'unmapped': len(result[1])}
+    return run, describe
+
+@benchmark('cross_mesh.vertex_map')
+def _cross_mesh_vertex_map(case):
+    dst = case.shuffled_mesh
+    run = lambda: vertex_mapping.make_vertex_map_array(case.mesh, dst, threshold=case.threshold)
+    describe = lambda result: {'mapped': int((result[0] != -1).sum()), 'unmapped': len(result[1])}
+    return run, describe
+
+@benchmark('cross_mesh.surface_map')
+def _cross_mesh_surface_map(case):
+    dst = case.coarse_mesh
+    run = lambda: vertex_mapping.make_surface_map(case.mesh, dst)
+    describe = lambda result: {'destination_vertices': len(result), 'mapped': int(result.matched.sum())}
+    return run, describe
+
+@benchmark('cross_mesh.interpolate')
+def _cross_mesh_interpolate(case):
+    dst = case.coarse_mesh
+    values = case.rng.uniform(size=(case.vertex_count, 4))
+    run = lambda: vertex_mapping.interpolate_vertex_values(case.mesh, dst, values, k=4)
+    describe = lambda result: {'destination_vertices': len(result), 'k': 4}
+    return run, describe
+
+# The RBF benchmark adds samples one at a time, like a zRBF node being set up, so only
+# this many vertices are used.
+_rbf_sample_count = 128
+
+@benchmark('rbf.grow')
+def _rbf_grow(case):
+    samples = case.points[:_rbf_sample_count]
+    values = case.rng.uniform(size=(len(samples), 2))
+
+    def run():
+        # Start from no samples, so the 0 -> 1 -> 2 steps are covered.  Until there are two
+        # samples nothing can be solved, but each RBF is still passed on as previous.
+        cache = rbf.FactorizationCache()
+        previous = None
+        solvable = 0
+        for count in range(len(samples) + 1):
+            previous = rbf.rbf(values[:count].tolist(), samples[:count].tolist(), cache=cache, previous=previous)
+            assert previous.solvable == (count >= 2)
+            solvable += previous.solvable
+        assert np.allclose(previous.eval_many(samples), values)
+        return solvable, cache
+
+    def describe(result):
+        solvable, cache = result
+        return {'samples': len(samples), 'solvable': solvable, 'incremental_solves': cache.incremental_solves}
+    return run, describe
+
+def _measure(run, repeat, measure_memory):
+    """
+    Run a benchmark repeat times, and once more to measure its peak memory.
+
+    Return (times, peak_memory, result).  peak_memory is the most memory allocated at once
+    by the run, or None if it can't be measured.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = timeit.default_timer()
+        result = run()
+        times.append(timeit.default_timer() - start)
+        del result
+
+    # Tracing allocations slows things down, so this is a separate run.  NumPy reports its
+    # array allocations to tracemalloc, so this includes array data.
+    peak_memory = None
+    if measure_memory and tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = run()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        result = run()
+
+    return times, peak_memory, result
+
+def run_benchmarks(options):
+    results = []
+    name_filter = re.compile(options.filter) if options.filter else None
+    selected = [(name, func, max_vertices) for name, func, max_vertices in benchmarks
+            if name_filter is None or name_filter.search(name)]
+
+    if name_filter is not None:
+        for name, func, size in opt_in_benchmarks:
+            if name_filter.search(name):
+                run, describe = func(size)
+                results.append(_run_benchmark(name, run, describe, None, size, size, options))
+
+    # Don't generate meshes if only opt-in benchmarks were selected.
+    if not selected:
+        return results
+
+    for mesh_type in options.meshes:
+        for size in options.sizes:
+            case = Case(mesh_type, size, options.queries)
+            for name, func, max_vertices in selected:
+                if isinstance(max_vertices, str):
+                    max_vertices = getattr(options, max_vertices)
+                if max_vertices is not None and case.vertex_count > max_vertices:
+                    continue
+
+                benchmark_func = func(case)
+                run, describe = benchmark_func if isinstance(benchmark_func, tuple) else (benchmark_func, None)
+                results.append(_run_benchmark(name, run, describe, mesh_type, size, case.vertex_count, options))
+
+    return results
+
+def _run_benchmark(name, run, describe, mesh_type, size, vertex_count, options):
+    times, peak_memory, result = _measure(run, options.repeat, not options.no_memory)
+
+    entry = {
+        'benchmark': name,
+        'mesh': mesh_type,
+        'size': size,
+        'vertices': vertex_count,
+        'seconds': min(times),
+        'times': times,
+        'peak_memory': peak_memory,
+        'details': describe(result) if describe else {},
+    }
+    del result
+
+    memory = '' if peak_memory is None else '  %8.1f MB' % (peak_memory / (1024.0 * 1024.0))
+    sys.stderr.write('%-24s %-8s %8i  %9.4fs%s\n' % (name, mesh_type or '-', vertex_count, entry['seconds'], memory))
+    return entry
+
+def _get_git_revision():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=_base_path, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+def get_metadata(options):
+    return {
+        'version': _results_version,
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'git_revision': _get_git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'repeat': options.repeat,
+        'queries': options.queries,
+    }
+
+def compare_results(results, baseline, tolerance):
+    """
+    Print how each result compares to the same benchmark in baseline.
+
+    Return the number of benchmarks that are more than tolerance times slower than the
+    baseline.
+    """
+    def get_key(entry):
+        return entry['benchmark'], entry['mesh'], entry['size']
+    baseline_entries = dict((get_key(entry), entry) for entry in baseline['results'])
+
+    regressions = 0
+    for entry in results:
+        old = baseline_entries.get(get_key(entry))
+        if old is None or not old['seconds']:
+            continue
+
+        ratio = entry['seconds'] / old['seconds']
+        flag = ''
+        if ratio > tolerance:
+            flag = '  SLOWER'
+            regressions += 1
+        elif ratio < 1.0 / tolerance:
+            flag = '  faster'
+
+        if old.get('details') != entry.get('details'):
+            flag += '  (details changed: %s -> %s)' % (old.get('details'), entry.get('details'))
+
+        print('%-24s %-8s %8i  %9.4fs -> %9.4fs  x%.2f%s' % (entry['benchmark'], entry['mesh'] or '-', entry['vertices'],
+            old['seconds'], entry['seconds'], ratio, flag))
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark zMayaTools spatial indexing and vertex mapping.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+            help='approximate vertex counts of the generated meshes')
+    parser.add_argument('--meshes', nargs='+', default=sorted(meshes.generators.keys()),
+            choices=sorted(meshes.generators.keys()), help='mesh types to generate')
+    parser.add_argument('--filter', help='only run benchmarks whose name matches this regex')
+    parser.add_argument('--repeat', type=int, default=3, help='time each benchmark this many times, and keep the fastest')
+    parser.add_argument('--queries', type=int, default=100000, help='the most points to search in query benchmarks')
+    parser.add_argument('--max-python-vertices', type=int, default=100000,
+            help='skip pure Python kd-tree benchmarks for meshes larger than this')
+    parser.add_argument('--no-memory', action='store_true', help='don\'t measure peak memory')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='compare against JSON results from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+            help='with --compare, report benchmarks more than this many times slower, and exit with an error')
+    parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+    options = parser.parse_args(argv)
+
+    if options.list:
+        for name, func, max_vertices in benchmarks:
+            print(name)
+        for name, func, size in opt_in_benchmarks:
+            print('%s (only with --filter)' % name)
+        return 0
+
+    results = run_benchmarks(options)
+    output = {
+        'metadata': get_metadata(options),
+        'results': results,
+    }
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    elif not options.compare:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, options.tolerance):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
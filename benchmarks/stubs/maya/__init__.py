@@ -0,0 +1,4 @@
+# A stand-in for the maya package, so zMayaTools modules can be imported by the benchmarks
+# under plain CPython.  None of these modules do anything.  Benchmarks only use mesh_arrays
+# adapters that don't need Maya, so anything that tries to use Maya will fail loudly with
+# an AttributeError.
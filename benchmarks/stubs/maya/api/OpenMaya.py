@@ -0,0 +1 @@
+# Stub for the benchmarks.  See maya/__init__.py.
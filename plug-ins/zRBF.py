@@ -35,9 +35,11 @@ class zRBF(OpenMayaMPx.MPxNode):
     def __init__(self, *args, **kwargs):
         super(zRBF, self).__init__(*args, **kwargs)
         self.rbf = None
+        self.channel_count = 0
 
     def compute(self, plug, data_block):
         if plug == self.attr_update:
+            previous_rbf = self.rbf
             self.rbf = None
 
             samples = []
@@ -50,9 +52,32 @@ class zRBF(OpenMayaMPx.MPxNode):
 
                 value_output = handle.child(zRBF.attr_value_Value)
                 samples.append(value_input.asFloat3())
-                outputs.append(value_output.asDouble())
 
-            self.rbf = rbf.rbf(outputs, samples)
+                # Each sample's output is its value, followed by its values for outValues.
+                output = [value_output.asDouble()]
+                channel_data = handle.child(zRBF.attr_value_Values).data()
+                if not channel_data.isNull():
+                    output.extend(om.MFnDoubleArrayData(channel_data).array())
+                outputs.append(output)
+
+            # Samples with fewer values than others are zero for the rest.  All channels are
+            # solved together, sharing one factorization of the kernel matrix.
+            channel_count = max(len(output) for output in outputs) if outputs else 1
+            for output in outputs:
+                output.extend([0.0] * (channel_count - len(output)))
+            self.channel_count = channel_count - 1
+
+            kernel = rbf.rbf.kernels[data_block.inputValue(self.attr_kernel).asShort()]
+            radius = data_block.inputValue(self.attr_radius).asDouble()
+
+            # Sample values are often edited without moving the samples, so the previous
+            # factorization, or one in the factorization cache, is reused to avoid refactoring
+            # the kernel matrix when only values have changed.  If a single sample was added,
+            # removed or moved instead, the previous factorization is updated.  See
+            # rbf.factorization_cache.full_solves, partial_solves and incremental_solves to
+            # see how often these help.
+            self.rbf = rbf.rbf(outputs, samples, cache=rbf.factorization_cache, previous=previous_rbf,
+                    kernel=kernel, radius=radius)
             return
 
         if plug == self.attr_solvable:
@@ -67,7 +92,8 @@ class zRBF(OpenMayaMPx.MPxNode):
             data_block.inputValue(self.attr_update)
 
             if plug.isArray():
-                return om.kUnknownParameter
+                self.compute_all_outputs(plug, data_block)
+                return
 
             idx = plug.logicalIndex()
 
@@ -79,7 +105,7 @@ class zRBF(OpenMayaMPx.MPxNode):
             except RuntimeError as e:
                 input_value = (0,0,0)
 
-            result = self.rbf.eval(input_value)
+            result = self.eval_channels([input_value])[0][0]
 
             output_value_factor_handle = data_block.outputArrayValue(self.attr_outValueFactor)
             try:
@@ -101,8 +127,90 @@ class zRBF(OpenMayaMPx.MPxNode):
             
             return
 
+        if plug == self.attr_outValues or plug == self.attr_outValues_Value:
+            data_block.inputValue(self.attr_update)
+
+            # Compute every channel of every output at once, even if only one was requested.
+            # They all come from the same evaluation.
+            indices, results = self.eval_all_inputs(data_block)
+
+            output_array_handle = data_block.outputArrayValue(self.attr_outValues)
+            builder = output_array_handle.builder()
+            for idx, result in zip(indices, results):
+                element_handle = builder.addElement(idx)
+                channel_array_handle = om.MArrayDataHandle(element_handle.child(self.attr_outValues_Value))
+                channel_builder = channel_array_handle.builder()
+                for channel, value in enumerate(result[1:]):
+                    channel_builder.addElement(channel).setDouble(value)
+                channel_array_handle.set(channel_builder)
+
+            output_array_handle.set(builder)
+            output_array_handle.setAllClean()
+            return
+
         return super(zRBF, self).compute(plug, data_block)
 
+    def eval_channels(self, inputs):
+        """
+        Evaluate the RBF at each input.
+
+        Return a list with [value, channel values...] for each input, where value is the
+        result for outValue and the channel values are the results for outValues.
+        """
+        if not self.rbf.solvable:
+            return [[0.0] * (self.channel_count + 1) for _ in inputs]
+        return [[float(value) for value in row] for row in self.rbf.eval_many(inputs)]
+
+    def eval_all_inputs(self, data_block):
+        """
+        Evaluate every input with a single eval_many, and apply outValueFactor.
+
+        Return (indices, results), with the logical index of each input and the results of
+        eval_channels.
+        """
+        indices = []
+        inputs = []
+        input_array_handle = data_block.inputArrayValue(self.inputAttr)
+        for idx in range(input_array_handle.elementCount()):
+            input_array_handle.jumpToArrayElement(idx)
+            indices.append(input_array_handle.elementIndex())
+            inputs.append(input_array_handle.inputValue().asFloat3())
+
+        results = self.eval_channels(inputs)
+
+        output_value_factor_handle = data_block.outputArrayValue(self.attr_outValueFactor)
+        for idx, result in zip(indices, results):
+            try:
+                output_value_factor_handle.jumpToElement(idx)
+                factor = output_value_factor_handle.inputValue().asDouble()
+            except RuntimeError as e:
+                continue
+            result[:] = [value * factor for value in result]
+
+        return indices, results
+
+    def compute_all_outputs(self, plug, data_block):
+        """
+        Compute every element of outValue or outAngleValue at once.
+
+        This evaluates all inputs with a single eval_many, instead of evaluating the RBF
+        separately for each output element.
+        """
+        indices, results = self.eval_all_inputs(data_block)
+
+        if plug == self.attr_outValue:
+            output_array_handle = data_block.outputArrayValue(self.attr_outValue)
+        else:
+            output_array_handle = data_block.outputArrayValue(self.attr_outputAngleValue)
+
+        builder = output_array_handle.builder()
+        for idx, result in zip(indices, results):
+            output_handle = builder.addElement(idx)
+            output_handle.setDouble(result[0])
+
+        output_array_handle.set(builder)
+        output_array_handle.setAllClean()
+
     @classmethod
     def initialize(cls):
         mAttr = om.MFnMatrixAttribute()
@@ -110,6 +218,7 @@ class zRBF(OpenMayaMPx.MPxNode):
         nAttr = om.MFnNumericAttribute()
         cmpAttr = om.MFnCompoundAttribute()
         uAttr = om.MFnUnitAttribute()
+        eAttr = om.MFnEnumAttribute()
 
         # This attribute is true if we're solvable.  If this is false, the input is invalid and
         # the output will always be zero.
@@ -134,6 +243,24 @@ class zRBF(OpenMayaMPx.MPxNode):
         uAttr.setUsesArrayDataBuilder(True)
         cls.addAttribute(cls.attr_outputAngleValue)
 
+        # Each element of outValues has the results for the corresponding input for every
+        # channel in value_Values.  This lets one node drive many outputs, solving the RBF
+        # only once for all of them.
+        cls.attr_outValues_Value = nAttr.create('outValues_Value', 'ovsv', om.MFnNumericData.kDouble, 0)
+        nAttr.setArray(True)
+        nAttr.setWritable(False)
+        nAttr.setStorable(False)
+        nAttr.setUsesArrayDataBuilder(True)
+        cls.addAttribute(cls.attr_outValues_Value)
+
+        cls.attr_outValues = cmpAttr.create('outValues', 'ovs')
+        cmpAttr.setArray(True)
+        cmpAttr.addChild(cls.attr_outValues_Value)
+        cmpAttr.setWritable(False)
+        cmpAttr.setStorable(False)
+        cmpAttr.setUsesArrayDataBuilder(True)
+        cls.addAttribute(cls.attr_outValues)
+
         # Each output value is multiplied by its corresponding value in this array.  This is
         # just a convenience to avoid needing a bunch of multiplyDivide nodes.
         cls.attr_outValueFactor = nAttr.create('outValueFactor', 'ovf', om.MFnNumericData.kDouble, 1)
@@ -141,6 +268,7 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_outValueFactor)
         cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outValue)
         cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_outValueFactor, cls.attr_outValues)
 
         cls.attr_update = nAttr.create('update', 'update', om.MFnNumericData.kBoolean)
         nAttr.setHidden(True)
@@ -148,11 +276,33 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_update)
         cls.attributeAffects(cls.attr_update, cls.attr_outValue)
         cls.attributeAffects(cls.attr_update, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_update, cls.attr_outValues)
+
+        # The RBF kernel.  The Wendland kernels are zero beyond radius, so samples only affect
+        # nearby samples.  This makes solving much faster with many samples.
+        cls.attr_kernel = eAttr.create('kernel', 'ker', 0)
+        for idx, name in enumerate(['Linear', 'Gaussian', 'Wendland C0', 'Wendland C2', 'Wendland C4']):
+            eAttr.addField(name, idx)
+        cls.addAttribute(cls.attr_kernel)
+
+        # The radius of the Wendland kernels, and the width of the Gaussian kernel.
+        cls.attr_radius = nAttr.create('radius', 'rad', om.MFnNumericData.kDouble, 1)
+        nAttr.setMin(0.0001)
+        nAttr.setSoftMax(10)
+        cls.addAttribute(cls.attr_radius)
+
+        for attr in (cls.attr_kernel, cls.attr_radius):
+            cls.attributeAffects(attr, cls.attr_outValue)
+            cls.attributeAffects(attr, cls.attr_outputAngleValue)
+            cls.attributeAffects(attr, cls.attr_outValues)
+            cls.attributeAffects(attr, cls.attr_update)
+            cls.attributeAffects(attr, cls.attr_solvable)
 
         cls.attr_value_Position = nAttr.createPoint('value_Position', 'vp')
         cls.addAttribute(cls.attr_value_Position)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Position, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_update)
         cls.attributeAffects(cls.attr_value_Position, cls.attr_solvable)
 
@@ -160,16 +310,29 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.attr_value_Value)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Value, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_update)
         cls.attributeAffects(cls.attr_value_Value, cls.attr_solvable)
 
+        # Each sample can have any number of values for outValues, in addition to its value
+        # for outValue.
+        cls.attr_value_Values = tAttr.create('value_Values', 'vvs', om.MFnData.kDoubleArray)
+        cls.addAttribute(cls.attr_value_Values)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outValue)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_outValues)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_update)
+        cls.attributeAffects(cls.attr_value_Values, cls.attr_solvable)
+
         cls.attr_value = cmpAttr.create('value', 'v')
         cmpAttr.setArray(True)
         cmpAttr.addChild(cls.attr_value_Position)
         cmpAttr.addChild(cls.attr_value_Value)
+        cmpAttr.addChild(cls.attr_value_Values)
         cls.addAttribute(cls.attr_value)
         cls.attributeAffects(cls.attr_value, cls.attr_outValue)
         cls.attributeAffects(cls.attr_value, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.attr_value, cls.attr_outValues)
         cls.attributeAffects(cls.attr_value, cls.attr_update)
         cls.attributeAffects(cls.attr_value, cls.attr_solvable)
 
@@ -178,6 +341,7 @@ class zRBF(OpenMayaMPx.MPxNode):
         cls.addAttribute(cls.inputAttr)
         cls.attributeAffects(cls.inputAttr, cls.attr_outValue)
         cls.attributeAffects(cls.inputAttr, cls.attr_outputAngleValue)
+        cls.attributeAffects(cls.inputAttr, cls.attr_outValues)
 
     @classmethod
     def creator(cls):
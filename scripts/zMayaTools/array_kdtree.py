@@ -0,0 +1,501 @@
+# A flat, array-backed kd-tree.
+#
+# kdtree.py creates a Python object for every point, which is very slow to build and
+# uses a lot of memory for meshes with hundreds of thousands of vertices.  This stores
+# the whole tree in a handful of NumPy arrays instead:
+#
+# - data: the points, reordered so every node's points are a contiguous range
+# - indices: the permutation from data back to the caller's point indices
+# - node_start/node_end: the range of data covered by each node
+# - node_axis/node_split: each internal node's split axis and value
+# - node_left/node_right: child node indices, or -1 for leaves
+# - node_lo/node_hi: each node's bounding box
+#
+# Leaves hold up to leaf_size points, which are searched together.
+#
+# Distances follow kdtree.KDNode: they're squared, not Euclidean.
+import os
+import numpy as np
+from zMayaTools import util
+
+class KDTree(object):
+    # The number of queries to search at once in query().
+    query_chunk_size = 16384
+
+    # The most padded cells to merge k>1 results with, before falling back on sorting.
+    _max_merge_cells = 1 << 22
+
+    def __init__(self, points, leaf_size=16):
+        """
+        Build a tree from an (N,D) array of points.  Anything np.asarray accepts can be
+        given, such as a list of (x, y, z) tuples.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2:
+            raise ValueError('points must be an (N,D) array')
+        if leaf_size < 1:
+            raise ValueError('leaf_size must be at least 1')
+
+        self.dimensions = points.shape[1]
+        self.leaf_size = leaf_size
+        self._build(points)
+
+    # The arrays that make up the tree, for save() and load().
+    _array_names = ('indices', 'data', 'node_start', 'node_end', 'node_axis', 'node_split',
+            'node_left', 'node_right', 'node_lo', 'node_hi')
+
+    def __len__(self):
+        return len(self.indices)
+
+    def save(self, path):
+        """
+        Save the tree to the directory path, as a .npy file for each array.
+        """
+        util.mkdir_p(path)
+        for name in self._array_names:
+            np.save(os.path.join(path, '%s.npy' % name), getattr(self, name))
+        np.save(os.path.join(path, 'leaf_size.npy'), np.array(self.leaf_size))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a tree saved with save().
+
+        If mmap is true, the arrays are memory mapped read-only instead of read into memory,
+        so loading is nearly instant and the pages are shared with other processes using
+        the same file.
+        """
+        mmap_mode = 'r' if mmap else None
+        tree = cls.__new__(cls)
+        for name in cls._array_names:
+            setattr(tree, name, np.load(os.path.join(path, '%s.npy' % name), mmap_mode=mmap_mode))
+        tree.leaf_size = int(np.load(os.path.join(path, 'leaf_size.npy')))
+        tree.dimensions = tree.data.shape[1]
+        return tree
+
+    def _build(self, points):
+        count = len(points)
+        perm = np.arange(count)
+
+        node_start = []
+        node_end = []
+        node_axis = []
+        node_split = []
+        node_left = []
+        node_right = []
+        node_lo = []
+        node_hi = []
+
+        def add_node(start, end):
+            node_start.append(start)
+            node_end.append(end)
+            node_axis.append(-1)
+            node_split.append(0.0)
+            node_left.append(-1)
+            node_right.append(-1)
+            node_lo.append(None)
+            node_hi.append(None)
+            return len(node_start) - 1
+
+        stack = [add_node(0, count)] if count else []
+        while stack:
+            node = stack.pop()
+            start, end = node_start[node], node_end[node]
+
+            node_points = points[perm[start:end]]
+            lo = node_points.min(axis=0)
+            hi = node_points.max(axis=0)
+            node_lo[node] = lo
+            node_hi[node] = hi
+
+            if end - start <= self.leaf_size:
+                continue
+
+            # Split on the axis with the largest extent.  If every point in this node is in
+            # the same place there's nothing to split, so leave it as a large leaf.
+            extent = hi - lo
+            axis = int(np.argmax(extent))
+            if extent[axis] == 0:
+                continue
+
+            # Partition around the median.  This is O(n) for each node, rather than sorting.
+            mid = (start + end) // 2
+            order = np.argpartition(node_points[:,axis], mid - start)
+            perm[start:end] = perm[start:end][order]
+
+            node_axis[node] = axis
+            node_split[node] = points[perm[mid], axis]
+            node_left[node] = add_node(start, mid)
+            node_right[node] = add_node(mid, end)
+
+            stack.append(node_right[node])
+            stack.append(node_left[node])
+
+        self.indices = perm
+        self.data = np.ascontiguousarray(points[perm])
+        self.node_start = np.array(node_start, dtype=np.intp)
+        self.node_end = np.array(node_end, dtype=np.intp)
+        self.node_axis = np.array(node_axis, dtype=np.intp)
+        self.node_split = np.array(node_split, dtype=np.float64)
+        self.node_left = np.array(node_left, dtype=np.intp)
+        self.node_right = np.array(node_right, dtype=np.intp)
+        self.node_lo = np.array(node_lo, dtype=np.float64).reshape(-1, self.dimensions)
+        self.node_hi = np.array(node_hi, dtype=np.float64).reshape(-1, self.dimensions)
+
+    def _check_points(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != self.dimensions:
+            raise ValueError('Expected an (N,%i) array of points' % self.dimensions)
+        return points
+
+    def query(self, points, k=1, max_distance=None, eps=0, stats=None):
+        """
+        Find the k nearest neighbors of each point in an (M,D) array of points.
+
+        Return (indices, distances).  If k is 1, these are arrays of shape (M,), otherwise
+        they're (M,k) and each row is ordered by distance.  If the tree has fewer than k
+        points, missing results have an index of -1 and a distance of inf.
+
+        If max_distance is given, only points within that distance are returned, and points
+        without a match within it get an index of -1 and a distance of inf.  Like the returned
+        distances, max_distance is squared.  Everything further away is pruned from the start,
+        so points without a match are about as fast to search as points with one.
+
+        If eps is greater than 0, the search is approximate: each result may be up to (1+eps)
+        times further away than the true neighbor (or (1+eps)**2 in squared distance), in
+        exchange for visiting fewer nodes.  This is useful when any close point is good
+        enough, such as when transferring weights.  Points with a true match within
+        max_distance still always get a match.
+
+        If stats is a dict, the total number of nodes visited by all queries is stored in
+        stats['visited_nodes'], to help tune eps.
+
+        All queries are searched together, so this is much faster than calling search_nn
+        for each point.
+        """
+        if k < 1:
+            raise ValueError('k must be greater than 0.')
+        if eps < 0:
+            raise ValueError('eps must not be negative.')
+
+        points = self._check_points(points)
+
+        # Start each query with the bound as its kth best distance, so anything further away
+        # is pruned.  Step it up slightly so points exactly at max_distance are included.
+        bound = np.inf if max_distance is None else np.nextafter(float(max_distance), np.inf)
+
+        best_dist = np.full((len(points), k), np.inf)
+        best_idx = np.full((len(points), k), -1, dtype=np.intp)
+
+        visited = 0
+        if len(self.node_start):
+            # Search in chunks, to limit the memory used by the candidate arrays.
+            for start in range(0, len(points), self.query_chunk_size):
+                end = start + self.query_chunk_size
+                dist, pos, chunk_visited = self._query_knn(points[start:end], k, bound, eps)
+                visited += chunk_visited
+                found = pos != -1
+                if max_distance is not None:
+                    found &= dist <= max_distance
+                best_dist[start:end][found] = dist[found]
+                best_idx[start:end][found] = self.indices[pos[found]]
+
+        if stats is not None:
+            stats['visited_nodes'] = visited
+
+        if k == 1:
+            return best_idx[:,0], best_dist[:,0]
+        return best_idx, best_dist
+
+    def _query_knn(self, points, k, bound, eps=0):
+        """
+        Search the tree for a batch of points, ignoring anything bound or further away.
+
+        Return (distances, positions, visited), where positions are indices into self.data
+        and visited is the number of nodes visited.  Results that weren't found have a
+        position of -1.
+        """
+        # For approximate searches, nodes are pruned once they can't be more than (1+eps)
+        # times closer than the current kth best.
+        prune_scale = 1.0 / ((1 + eps) * (1 + eps))
+
+        best_dist = np.full((len(points), k), bound)
+        best_pos = np.full((len(points), k), -1, dtype=np.intp)
+
+        # Start by searching the leaf each point falls in.  This usually finds a close
+        # match quickly, which lets most of the tree be pruned below.  If the leaf has fewer
+        # than k points nothing could be pruned, so search the smallest node above it that
+        # has at least k points instead.
+        queries = np.arange(len(points))
+        first_node = self._find_leaves(points, min_size=k)
+        first_start = self.node_start[first_node]
+        first_end = self.node_end[first_node]
+        self._scan_leaves(points, queries, first_node, best_dist, best_pos)
+        visited = len(queries)
+
+        # Walk the tree a level at a time, with a (query, node) pair for every node each
+        # query still needs to visit.  Pairs are dropped when the node's bounding box is
+        # no closer than the query's kth best distance.
+        pair_query = queries
+        pair_node = np.zeros(len(points), dtype=np.intp)
+        while len(pair_query):
+            box_dist = self._box_distances(points[pair_query], pair_node)
+            limit = best_dist[pair_query, k-1]
+            if eps:
+                # Only scale the limit once a kth result has been found.  Until then it's
+                # still the caller's bound, and scaling it could miss the only match.
+                limit = np.where(best_pos[pair_query, k-1] != -1, limit * prune_scale, limit)
+            keep = box_dist < limit
+            pair_query = pair_query[keep]
+            pair_node = pair_node[keep]
+            visited += len(pair_query)
+
+            is_leaf = self.node_left[pair_node] == -1
+            leaf_query = pair_query[is_leaf]
+            leaf_node = pair_node[is_leaf]
+
+            # Skip the leaves we already searched.
+            unsearched = (self.node_start[leaf_node] < first_start[leaf_query]) | (self.node_end[leaf_node] > first_end[leaf_query])
+            self._scan_leaves(points, leaf_query[unsearched], leaf_node[unsearched], best_dist, best_pos)
+
+            parent_query = pair_query[~is_leaf]
+            parent_node = pair_node[~is_leaf]
+            pair_query = np.concatenate([parent_query, parent_query])
+            pair_node = np.concatenate([self.node_left[parent_node], self.node_right[parent_node]])
+
+        return best_dist, best_pos, visited
+
+    def _find_leaves(self, points, min_size=1):
+        """
+        Return the leaf node each point in points falls in.
+
+        If min_size is greater than 1, stop at the last node on the way with at least that
+        many points.
+        """
+        node = np.zeros(len(points), dtype=np.intp)
+        while True:
+            internal = np.flatnonzero(self.node_left[node] != -1)
+            parent = node[internal]
+            go_right = points[internal, self.node_axis[parent]] >= self.node_split[parent]
+            child = np.where(go_right, self.node_right[parent], self.node_left[parent])
+
+            big_enough = self.node_end[child] - self.node_start[child] >= min_size
+            if not big_enough.any():
+                return node
+            node[internal[big_enough]] = child[big_enough]
+
+    def _box_distances(self, points, nodes):
+        """
+        Return the squared distance from each point to the bounding box of the corresponding node.
+        """
+        delta = np.maximum(self.node_lo[nodes] - points, 0)
+        delta += np.maximum(points - self.node_hi[nodes], 0)
+        return np.einsum('ij,ij->i', delta, delta)
+
+    def _leaf_candidates(self, points, queries, leaves):
+        """
+        Expand (query, leaf) pairs into a (query, position, distance) entry for every point
+        in each leaf.
+        """
+        starts = self.node_start[leaves]
+        counts = self.node_end[leaves] - starts
+        group_starts = np.cumsum(counts) - counts
+        offsets = np.arange(counts.sum()) - np.repeat(group_starts, counts)
+        cand_query = np.repeat(queries, counts)
+        cand_pos = np.repeat(starts, counts) + offsets
+
+        delta = self.data[cand_pos] - points[cand_query]
+        cand_dist = np.einsum('ij,ij->i', delta, delta)
+        return cand_query, cand_pos, cand_dist
+
+    def _scan_leaves(self, points, queries, leaves, best_dist, best_pos):
+        """
+        Compare each query against the points in its leaf, and merge them into the results.
+        """
+        if not len(queries):
+            return
+
+        cand_query, cand_pos, cand_dist = self._leaf_candidates(points, queries, leaves)
+
+        k = best_dist.shape[1]
+        if k == 1:
+            # With only one result per query, we don't need to sort.  Update the best distance,
+            # then take the position of the candidates that match it.
+            best = best_dist[:,0]
+            np.minimum.at(best, cand_query, cand_dist)
+            won = cand_dist == best[cand_query]
+            best_pos[cand_query[won], 0] = cand_pos[won]
+            return
+
+        # Drop candidates that are no closer than the current kth result, since they can't
+        # make it into the results.  After the first few leaves, this is most of them.
+        closer = cand_dist < best_dist[cand_query, k-1]
+        cand_query = cand_query[closer]
+        cand_pos = cand_pos[closer]
+        cand_dist = cand_dist[closer]
+        if not len(cand_query):
+            return
+
+        # Group the candidates by query.
+        order = np.argsort(cand_query, kind='stable')
+        cand_query = cand_query[order]
+        cand_pos = cand_pos[order]
+        cand_dist = cand_dist[order]
+        group_starts = np.flatnonzero(np.r_[True, cand_query[1:] != cand_query[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(cand_query)])
+        updated = cand_query[group_starts]
+
+        # Lay out each updated query's current results and new candidates in a row, padded
+        # with inf, and select the k best of each row.  This is much faster than sorting
+        # everything together, but if a few queries have far more candidates than the rest
+        # the padding can get too big, so merge those by sorting instead.
+        width = k + int(group_sizes.max())
+        if len(updated) * width > max(4 * (len(cand_query) + len(updated) * k), self._max_merge_cells):
+            self._merge_sorted(updated, cand_query, cand_pos, cand_dist, best_dist, best_pos)
+            return
+
+        row = np.repeat(np.arange(len(updated)), group_sizes)
+        column = k + np.arange(len(cand_query)) - np.repeat(group_starts, group_sizes)
+        dist_rows = np.full((len(updated), width), np.inf)
+        pos_rows = np.full((len(updated), width), -1, dtype=np.intp)
+        dist_rows[:,:k] = best_dist[updated]
+        pos_rows[:,:k] = best_pos[updated]
+        dist_rows[row, column] = cand_dist
+        pos_rows[row, column] = cand_pos
+
+        selected = np.argpartition(dist_rows, k-1, axis=1)[:,:k]
+        selected_dist = np.take_along_axis(dist_rows, selected, axis=1)
+        ranked = np.argsort(selected_dist, axis=1)
+        best_dist[updated] = np.take_along_axis(selected_dist, ranked, axis=1)
+        best_pos[updated] = np.take_along_axis(np.take_along_axis(pos_rows, selected, axis=1), ranked, axis=1)
+
+    def _merge_sorted(self, updated, cand_query, cand_pos, cand_dist, best_dist, best_pos):
+        """
+        Merge candidates into the results of the queries in updated by sorting them all
+        together, and keep the k best for each query.
+        """
+        k = best_dist.shape[1]
+        cand_query = np.concatenate([cand_query, np.repeat(updated, k)])
+        cand_dist = np.concatenate([cand_dist, best_dist[updated].ravel()])
+        cand_pos = np.concatenate([cand_pos, best_pos[updated].ravel()])
+
+        order = np.lexsort((cand_dist, cand_query))
+        cand_query = cand_query[order]
+        group_starts = np.flatnonzero(np.r_[True, cand_query[1:] != cand_query[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(cand_query)])
+        rank = np.arange(len(cand_query)) - np.repeat(group_starts, group_sizes)
+
+        # Every query has at least k entries, since its old results are included.
+        keep = rank < k
+        selected = order[keep]
+        best_dist[cand_query[keep], rank[keep]] = cand_dist[selected]
+        best_pos[cand_query[keep], rank[keep]] = cand_pos[selected]
+
+    def query_radius(self, points, radius, return_distances=False):
+        """
+        Find all points within radius of each point in an (M,D) array of points.
+
+        Unlike the other queries, radius is a regular distance and not squared.
+
+        The result is returned in compressed sparse row form as (offsets, indices): the
+        neighbors of points[i] are indices[offsets[i]:offsets[i+1]], in ascending order.
+        offsets has M+1 entries.  If a query point is also in the tree, it'll be included
+        in its own results.
+
+        If return_distances is true, return (offsets, indices, distances), where distances
+        are the squared distance to each neighbor.
+        """
+        points = self._check_points(points)
+        radius_sq = float(radius) * float(radius)
+
+        found_query = []
+        found_pos = []
+        found_dist = []
+        if len(self.node_start):
+            for start in range(0, len(points), self.query_chunk_size):
+                end = start + self.query_chunk_size
+                query, pos, dist = self._query_radius(points[start:end], radius_sq)
+                found_query.append(query + start)
+                found_pos.append(pos)
+                found_dist.append(dist)
+
+        if found_query:
+            query = np.concatenate(found_query)
+            indices = self.indices[np.concatenate(found_pos)]
+            distances = np.concatenate(found_dist)
+        else:
+            query = np.zeros(0, dtype=np.intp)
+            indices = np.zeros(0, dtype=np.intp)
+            distances = np.zeros(0)
+
+        order = np.lexsort((indices, query))
+        counts = np.bincount(query, minlength=len(points))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.intp)
+        if return_distances:
+            return offsets, indices[order], distances[order]
+        else:
+            return offsets, indices[order]
+
+    def _query_radius(self, points, radius_sq):
+        """
+        Search the tree for all points within a squared radius of a batch of points.
+
+        Return (queries, positions, distances) for each match, in no particular order.
+        """
+        found_query = []
+        found_pos = []
+        found_dist = []
+
+        # This is the same traversal as _query_knn, but with a fixed bound.
+        pair_query = np.arange(len(points))
+        pair_node = np.zeros(len(points), dtype=np.intp)
+        while len(pair_query):
+            box_dist = self._box_distances(points[pair_query], pair_node)
+            keep = box_dist <= radius_sq
+            pair_query = pair_query[keep]
+            pair_node = pair_node[keep]
+
+            is_leaf = self.node_left[pair_node] == -1
+            if is_leaf.any():
+                cand_query, cand_pos, cand_dist = self._leaf_candidates(points, pair_query[is_leaf], pair_node[is_leaf])
+                within = cand_dist <= radius_sq
+                found_query.append(cand_query[within])
+                found_pos.append(cand_pos[within])
+                found_dist.append(cand_dist[within])
+
+            parent_query = pair_query[~is_leaf]
+            parent_node = pair_node[~is_leaf]
+            pair_query = np.concatenate([parent_query, parent_query])
+            pair_node = np.concatenate([self.node_left[parent_node], self.node_right[parent_node]])
+
+        if not found_query:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+        return np.concatenate(found_query), np.concatenate(found_pos), np.concatenate(found_dist)
+
+    def search_knn(self, point, k, eps=0, stats=None):
+        """
+        Return the k nearest neighbors of point and their distances.
+
+        The result is a list of (index, distance) tuples ordered by distance, where index
+        is the index of the point in the array the tree was created with.  Fewer than k
+        results are returned if the tree has fewer than k points.
+
+        eps and stats are the same as for query().
+        """
+        point = np.asarray(point, dtype=np.float64)
+        if point.shape != (self.dimensions,):
+            raise ValueError('Expected a point with %i dimensions' % self.dimensions)
+
+        indices, distances = self.query(point[np.newaxis], k, eps=eps, stats=stats)
+        indices = np.atleast_1d(indices[0])
+        distances = np.atleast_1d(distances[0])
+        return [(int(idx), float(d)) for idx, d in zip(indices, distances) if idx != -1]
+
+    def search_nn(self, point, eps=0, stats=None):
+        """
+        Return the nearest neighbor of point as an (index, distance) tuple, or None if
+        the tree is empty.
+
+        eps and stats are the same as for query().
+        """
+        return next(iter(self.search_knn(point, 1, eps, stats)), None)
@@ -0,0 +1,147 @@
+# A uniform hash grid for fixed-radius nearest-neighbor matching.
+#
+# This is an alternative to array_kdtree.KDTree for the common case of matching points
+# within a small, fixed tolerance, such as matching vertices between meshes with the
+# same topology.  Points are bucketed into cells of cell_size, so a point's match can
+# only be in its own cell or one of the cells next to it (27 cells in 3D).
+#
+# Cells are identified by hashing their integer coordinates.  Hash collisions just merge
+# cells, which adds candidates but can't cause a match to be missed, since candidates are
+# always checked by distance.
+#
+# Distances are squared, like array_kdtree.
+import itertools
+import numpy as np
+
+# Multipliers for hashing cell coordinates.  Overflow wraps around, which is fine for
+# hashing.
+_hash_primes = np.array([73856093, 19349663, 83492791, 49979687, 67867967, 86028121], dtype=np.int64)
+
+class HashGrid(object):
+    # The number of queries to search at once in query().
+    query_chunk_size = 65536
+
+    def __init__(self, points, cell_size):
+        """
+        Build a grid from an (N,D) array of points.
+
+        cell_size is the largest distance (not squared) that can be searched for.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2:
+            raise ValueError('points must be an (N,D) array')
+        if not 1 <= points.shape[1] <= len(_hash_primes):
+            raise ValueError('HashGrid supports 1 to %i dimensions' % len(_hash_primes))
+        if not cell_size > 0:
+            raise ValueError('cell_size must be positive')
+
+        self.dimensions = points.shape[1]
+        self.cell_size = float(cell_size)
+
+        # Sort the points by cell, so each cell's points are a contiguous range, and make
+        # a sorted table of the cells that have any points.
+        keys = self._hash_cells(self._get_cells(points))
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        self.indices = order
+        self.data = np.ascontiguousarray(points[order])
+        self.cell_keys, self.cell_start = np.unique(keys, return_index=True)
+        self.cell_end = np.append(self.cell_start[1:], len(keys))
+
+        # The offsets to each neighboring cell, including the cell itself.  Search the cell
+        # itself first, then cells sharing a face, since they're the most likely to contain
+        # the closest point.
+        offsets = sorted(itertools.product((-1, 0, 1), repeat=self.dimensions), key=lambda offset: sum(map(abs, offset)))
+        self._neighbor_offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _get_cells(self, points):
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    def _hash_cells(self, cells):
+        primes = _hash_primes[:self.dimensions]
+        with np.errstate(over='ignore'):
+            return np.bitwise_xor.reduce(cells * primes, axis=1)
+
+    def query(self, points, max_distance=None):
+        """
+        Find the nearest neighbor of each point in an (M,D) array of points, within
+        max_distance.
+
+        Return (indices, distances), in the same form as array_kdtree.KDTree.query with k=1:
+        points without a match have an index of -1 and a distance of inf.  max_distance
+        is squared, and defaults to the largest distance the grid can search, cell_size
+        squared.
+        """
+        # Allow a little slack, so rounding doesn't reject max_distance=cell_size**2.
+        if max_distance is None:
+            max_distance = self.cell_size * self.cell_size
+        elif max_distance > self.cell_size * self.cell_size * (1 + 1e-9):
+            raise ValueError('max_distance %f is larger than the grid supports' % max_distance)
+
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != self.dimensions:
+            raise ValueError('Expected an (N,%i) array of points' % self.dimensions)
+
+        best_idx = np.full(len(points), -1, dtype=np.intp)
+        best_dist = np.full(len(points), np.inf)
+        if not len(self.cell_keys):
+            return best_idx, best_dist
+
+        for start in range(0, len(points), self.query_chunk_size):
+            end = start + self.query_chunk_size
+            pos, dist = self._query(points[start:end], max_distance)
+            found = pos != -1
+            best_idx[start:end][found] = self.indices[pos[found]]
+            best_dist[start:end][found] = dist[found]
+
+        return best_idx, best_dist
+
+    def _query(self, points, max_distance):
+        best_pos = np.full(len(points), -1, dtype=np.intp)
+        best_dist = np.full(len(points), np.inf)
+        cells = self._get_cells(points)
+
+        # The distance from each point to the lower and upper faces of its cell on each axis.
+        lower_gap = points - cells * self.cell_size
+        upper_gap = self.cell_size - lower_gap
+
+        for offset in self._neighbor_offsets:
+            # Skip queries that are already closer to a match than they are to this cell.
+            # Once the query's own cell has been searched, this usually skips most of them.
+            gap = np.where(offset < 0, lower_gap, np.where(offset > 0, upper_gap, 0))
+            cell_dist = np.einsum('ij,ij->i', gap, gap)
+            queries = np.flatnonzero((cell_dist <= max_distance) & (cell_dist < best_dist))
+
+            # Look up the neighboring cell for each query.  Many of these will be empty.
+            keys = self._hash_cells(cells[queries] + offset)
+            slot = np.searchsorted(self.cell_keys, keys)
+            slot[slot == len(self.cell_keys)] = 0
+            found = self.cell_keys[slot] == keys
+            queries = queries[found]
+            slot = slot[found]
+            if not len(queries):
+                continue
+
+            # Expand each query into a candidate for every point in the cell.
+            starts = self.cell_start[slot]
+            counts = self.cell_end[slot] - starts
+            group_starts = np.cumsum(counts) - counts
+            cand_query = np.repeat(queries, counts)
+            cand_pos = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(group_starts, counts)
+
+            delta = self.data[cand_pos] - points[cand_query]
+            cand_dist = np.einsum('ij,ij->i', delta, delta)
+            within = cand_dist <= max_distance
+            cand_query = cand_query[within]
+            cand_pos = cand_pos[within]
+            cand_dist = cand_dist[within]
+
+            np.minimum.at(best_dist, cand_query, cand_dist)
+            won = cand_dist == best_dist[cand_query]
+            best_pos[cand_query[won]] = cand_pos[won]
+
+        return best_pos, best_dist
@@ -43,6 +43,9 @@ class Node(object):
     A tree is represented by its root node, and every node represents
     its subtree"""
 
+    # Trees can have a very large number of nodes, so avoid a __dict__ for each.
+    __slots__ = ('data', 'left', 'right')
+
     def __init__(self, data=None, left=None, right=None):
         self.data = data
         self.left = left
@@ -63,55 +66,56 @@ class Node(object):
                (all(not bool(c) for c, p in self.children))
 
 
+    # The traversals below use explicit stacks rather than recursion, so deep
+    # trees don't create a generator per level or hit the recursion limit.
+
     def preorder(self):
         """ iterator for nodes: root, left, right """
 
-        if not self:
-            return
-
-        yield self
+        stack = [self] if self else []
+        while stack:
+            node = stack.pop()
+            yield node
 
-        if self.left:
-            for x in self.left.preorder():
-                yield x
-
-        if self.right:
-            for x in self.right.preorder():
-                yield x
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
 
 
     def inorder(self):
         """ iterator for nodes: left, root, right """
 
-        if not self:
-            return
-
-        if self.left:
-            for x in self.left.inorder():
-                yield x
+        stack = []
+        node = self
+        while stack or node:
+            # Descend to the leftmost node, remembering the path.
+            while node:
+                stack.append(node)
+                node = node.left
 
-        yield self
-
-        if self.right:
-            for x in self.right.inorder():
-                yield x
+            node = stack.pop()
+            yield node
+            node = node.right
 
 
     def postorder(self):
         """ iterator for nodes: left, right, root """
 
-        if not self:
-            return
-
-        if self.left:
-            for x in self.left.postorder():
-                yield x
+        # Each node is pushed twice: once to visit its children, and once to
+        # yield it after they're done.
+        stack = [(self, False)] if self else []
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                yield node
+                continue
 
-        if self.right:
-            for x in self.right.postorder():
-                yield x
-
-        yield self
+            stack.append((node, True))
+            if node.right:
+                stack.append((node.right, False))
+            if node.left:
+                stack.append((node.left, False))
 
 
     @property
@@ -164,8 +168,15 @@ class Node(object):
         2
         """
 
-        min_height = int(bool(self))
-        return max([min_height] + [c.height()+1 for c, p in self.children])
+        height = 0
+        stack = [(self, 1)] if self else []
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            for c, p in node.children:
+                stack.append((c, depth+1))
+
+        return height
 
 
     def get_child_pos(self, child):
@@ -218,6 +229,13 @@ def require_axis(f):
 class KDNode(Node):
     """ A Node that contains kd-tree specific data and methods """
 
+    # The largest fraction of a subtree's points that may be in one of its
+    # children.  When add() or remove() leave a subtree more unbalanced than
+    # this, the subtree is rebuilt.  This should be between 0.5 (perfectly
+    # balanced) and 1 (never rebuild).
+    balance_factor = 0.7
+
+    __slots__ = ('axis', 'sel_axis', 'dimensions', 'size')
 
     def __init__(self, data=None, left=None, right=None, axis=None,
             sel_axis=None, dimensions=None):
@@ -233,6 +251,55 @@ class KDNode(Node):
         self.axis = axis
         self.sel_axis = sel_axis
         self.dimensions = dimensions
+        self._update_size()
+
+
+    def _update_size(self):
+        """ Update the number of points in the subtree from its children """
+
+        self.size = int(self.data is not None)
+        for child in (self.left, self.right):
+            if child is not None:
+                self.size += child.size
+
+
+    @property
+    def weight_balance(self):
+        """
+        Returns the fraction of the subtree's points that are in its larger
+        child.  This is cheap, since subtree sizes are kept up to date.
+
+        >>> create([ (1, 2), (2, 3), (3, 4) ]).weight_balance
+        0.3333333333333333
+        """
+
+        if not self.size:
+            return 0.0
+
+        child_sizes = [c.size if c is not None else 0 for c in (self.left, self.right)]
+        return max(child_sizes) / float(self.size)
+
+
+    def _needs_rebuild(self):
+        # Very small subtrees can't always be split evenly.
+        return self.size > 2 and self.weight_balance > self.balance_factor
+
+
+    def _rebuild(self):
+        """ Rebuilds the subtree in place as a balanced tree """
+
+        points = [node.data for node in self.inorder()]
+        if not points:
+            return
+
+        tree = create(points, dimensions=self.dimensions, axis=self.axis,
+                sel_axis=self.sel_axis)
+
+        # create() may have split on a different axis, if the points are all
+        # the same on this one.
+        self.data, self.left, self.right = tree.data, tree.left, tree.right
+        self.axis = tree.axis
+        self._update_size()
 
 
     @require_axis
@@ -242,31 +309,57 @@ class KDNode(Node):
         descends to one of its children.
 
         Users should call add() only to the topmost tree.
+
+        If this leaves a subtree out of balance, the largest unbalanced
+        subtree on the path to the new node is rebuilt.
         """
 
         current = self
+        path = []
         while True:
             check_dimensionality([point], dimensions=current.dimensions)
 
             # Adding has hit an empty leaf-node, add here
             if current.data is None:
                 current.data = point
-                return current
+                added = current
+                break
+
+            path.append(current)
 
             # split on self.axis, recurse either left or right
             if point[current.axis] < current.data[current.axis]:
                 if current.left is None:
                     current.left = current.create_subnode(point)
-                    return current.left
+                    added = current.left
+                    break
                 else:
                     current = current.left
             else:
                 if current.right is None:
                     current.right = current.create_subnode(point)
-                    return current.right
+                    added = current.right
+                    break
                 else:
                     current = current.right
 
+        added._update_size()
+        for node in path:
+            node.size += 1
+
+        # Rebuild the topmost subtree that's out of balance.  This rebalances
+        # everything below it too, and since a rebuilt subtree needs many
+        # more changes before it becomes unbalanced again, rebuilding is cheap
+        # when amortized over insertions.
+        for node in path:
+            if node._needs_rebuild():
+                node._rebuild()
+
+                # The node we added was replaced, so find the new one.
+                return next(n for n in node.inorder() if n.data is point)
+
+        return added
+
 
     @require_axis
     def create_subnode(self, data):
@@ -285,12 +378,17 @@ class KDNode(Node):
         The replacement is returned as a
         (replacement-node, replacements-parent-node) tuple """
 
+        path = self._find_replacement_path()
+        return path[-1], path[-2]
+
+
+    def _find_replacement_path(self):
+        """ Returns the path from the current node to its replacement """
+
         if self.right:
-            child, parent = self.right.extreme_child(min, self.axis)
+            return [self] + self.right._extreme_path(min, self.axis)
         else:
-            child, parent = self.left.extreme_child(max, self.axis)
-
-        return (child, parent if parent is not None else self)
+            return [self] + self.left._extreme_path(max, self.axis)
 
 
     def should_remove(self, point, node):
@@ -309,7 +407,9 @@ class KDNode(Node):
 
         If there are multiple points matching "point", only one is removed. The
         optional "node" parameter is used for checking the identity, once the
-        removeal candidate is decided."""
+        removeal candidate is decided.
+
+        Subtrees left out of balance by the removal are rebuilt."""
 
         # Recursion has reached an empty leaf node, nothing here to delete
         if not self:
@@ -335,6 +435,10 @@ class KDNode(Node):
             if self.right:
                 self.right = self.right.remove(point, node)
 
+        self._update_size()
+        if self._needs_rebuild():
+            self._rebuild()
+
         return self
 
 
@@ -345,12 +449,14 @@ class KDNode(Node):
         # deleting a leaf node is trivial
         if self.is_leaf:
             self.data = None
+            self._update_size()
             return self
 
         # we have to delete a non-leaf node here
 
         # find a replacement for the node (will be the new subtree-root)
-        root, max_p = self.find_replacement()
+        path = self._find_replacement_path()
+        root, max_p = path[-1], path[-2]
 
         # self and root swap positions
         tmp_l, tmp_r = self.left, self.right
@@ -367,6 +473,11 @@ class KDNode(Node):
         else:
             root.remove(point, self)
 
+        # The nodes between root and max_p each lost a point.  max_p was
+        # recounted by remove(), and root's children are now up to date.
+        for node in path[1:-2]:
+            node.size -= 1
+        root._update_size()
         return root
 
 
@@ -375,15 +486,21 @@ class KDNode(Node):
         """ Returns True if the (sub)tree is balanced
 
         The tree is balanced if the heights of both subtrees differ at most by
-        1 """
+        1.  This computes the height of every node in a single pass, rather
+        than calling height() on both sides of each node.
 
-        left_height = self.left.height() if self.left else 0
-        right_height = self.right.height() if self.right else 0
+        For a cheap measure of how unbalanced a subtree is, see weight_balance.
+        """
 
-        if abs(left_height - right_height) > 1:
-            return False
+        heights = {}
+        for node in self.postorder():
+            child_heights = [heights.get(id(c), 0) if c else 0
+                    for c in (node.left, node.right)]
+            if abs(child_heights[0] - child_heights[1]) > 1:
+                return False
+            heights[id(node)] = max(child_heights) + 1
 
-        return all(c.is_balanced for c, _ in self.children)
+        return True
 
 
     def rebalance(self):
@@ -411,7 +528,7 @@ class KDNode(Node):
         return sum([self.axis_dist(point, i) for i in r])
 
 
-    def search_knn(self, point, k, dist=None):
+    def search_knn(self, point, k, dist=None, eps=0, stats=None):
         """ Return the k nearest neighbors of point and their distances
 
         point must be an actual point, not a node.
@@ -423,11 +540,20 @@ class KDNode(Node):
         dist is a distance function, expecting two points and returning a
         distance value. Distance values can be any comparable type.
 
+        If eps is greater than 0, the search is approximate: each result may
+        be up to (1+eps) times further away than the true neighbor (or
+        (1+eps)**2 in squared distance), in exchange for visiting fewer nodes.
+
+        If stats is a dict, the number of nodes visited is stored in
+        stats['visited_nodes'].
+
         The result is an ordered list of (node, distance) tuples.
         """
 
         if k < 1:
             raise ValueError("k must be greater than 0.")
+        if eps < 0:
+            raise ValueError("eps must not be negative.")
 
         if dist is None:
             get_dist = lambda n: n.dist(point)
@@ -436,61 +562,81 @@ class KDNode(Node):
 
         results = []
 
-        self._search_node(point, k, results, get_dist, itertools.count())
+        visited = self._search_node(point, k, results, get_dist,
+                                    itertools.count(), eps)
+        if stats is not None:
+            stats['visited_nodes'] = visited
 
         # We sort the final result by the distance in the tuple
         # (<KdNode>, distance).
         return [(node, -d) for d, _, node in sorted(results, reverse=True)]
 
 
-    def _search_node(self, point, k, results, get_dist, counter):
-        if not self:
-            return
-
-        nodeDist = get_dist(self)
-
-        # Add current node to the priority queue if it closer than
-        # at least one point in the queue.
+    def _search_node(self, point, k, results, get_dist, counter, eps=0):
+        # Returns the number of nodes visited.
         #
-        # If the heap is at its capacity, we need to check if the
-        # current node is closer than the current farthest node, and if
-        # so, replace it.
-        item = (-nodeDist, next(counter), self)
-        if len(results) >= k:
-            if -nodeDist > results[0][0]:
-                heapq.heapreplace(results, item)
-        else:
-            heapq.heappush(results, item)
-        # get the splitting plane
-        split_plane = self.data[self.axis]
-        # get the squared distance between the point and the splitting plane
-        # (squared since all distances are squared).
-        plane_dist = point[self.axis] - split_plane
-        plane_dist2 = plane_dist * plane_dist
-
-        # Search the side of the splitting plane that the point is in
-        if point[self.axis] < split_plane:
-            if self.left is not None:
-                self.left._search_node(point, k, results, get_dist, counter)
-        else:
-            if self.right is not None:
-                self.right._search_node(point, k, results, get_dist, counter)
-
-        # Search the other side of the splitting plane if it may contain
-        # points closer than the farthest point in the current results.
-        if -plane_dist2 > results[0][0] or len(results) < k:
-            if point[self.axis] < self.data[self.axis]:
-                if self.right is not None:
-                    self.right._search_node(point, k, results, get_dist,
-                                            counter)
+        # Each stack entry is (node, None) to search node, or (node, far) to
+        # decide whether to search far, the other side of node's splitting
+        # plane, once the near side has been searched.
+        #
+        # For approximate searches, the far side is only searched if it
+        # could hold a point more than (1+eps) times closer than the current
+        # results.
+        plane_scale = (1 + eps) * (1 + eps)
+        visited = 0
+        stack = [(self, None)]
+        while stack:
+            node, far = stack.pop()
+
+            if far is not None:
+                # get the squared distance between the point and the
+                # splitting plane (squared since all distances are squared).
+                plane_dist = point[node.axis] - node.data[node.axis]
+                plane_dist2 = plane_dist * plane_dist * plane_scale
+
+                # Search the other side of the splitting plane if it may
+                # contain points closer than the farthest point in the
+                # current results.
+                if -plane_dist2 > results[0][0] or len(results) < k:
+                    stack.append((far, None))
+                continue
+
+            if not node:
+                continue
+
+            visited += 1
+            nodeDist = get_dist(node)
+
+            # Add current node to the priority queue if it closer than
+            # at least one point in the queue.
+            #
+            # If the heap is at its capacity, we need to check if the
+            # current node is closer than the current farthest node, and if
+            # so, replace it.
+            item = (-nodeDist, next(counter), node)
+            if len(results) >= k:
+                if -nodeDist > results[0][0]:
+                    heapq.heapreplace(results, item)
+            else:
+                heapq.heappush(results, item)
+
+            # Search the side of the splitting plane that the point is in
+            # first, then check the other side.
+            if point[node.axis] < node.data[node.axis]:
+                near, far = node.left, node.right
             else:
-                if self.left is not None:
-                    self.left._search_node(point, k, results, get_dist,
-                                           counter)
+                near, far = node.right, node.left
+
+            if far is not None:
+                stack.append((node, far))
+            if near is not None:
+                stack.append((near, None))
+
+        return visited
 
 
     @require_axis
-    def search_nn(self, point, dist=None):
+    def search_nn(self, point, dist=None, eps=0, stats=None):
         """
         Search the nearest node of the given point
 
@@ -501,31 +647,37 @@ class KDNode(Node):
         dist is a distance function, expecting two points and returning a
         distance value. Distance values can be any comparable type.
 
+        eps and stats are the same as for search_knn.
+
         The result is a (node, distance) tuple.
         """
 
-        return next(iter(self.search_knn(point, 1, dist)), None)
+        return next(iter(self.search_knn(point, 1, dist, eps, stats)), None)
 
 
     def _search_nn_dist(self, point, dist, results, get_dist):
-        if not self:
-            return
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node:
+                continue
 
-        nodeDist = get_dist(self)
+            nodeDist = get_dist(node)
 
-        if nodeDist < dist:
-            results.append(self.data)
+            if nodeDist < dist:
+                results.append(node.data)
 
-        # get the splitting plane
-        split_plane = self.data[self.axis]
+            # get the splitting plane
+            split_plane = node.data[node.axis]
 
-        # Search the side of the splitting plane that the point is in
-        if point[self.axis] <= split_plane + dist:
-            if self.left is not None:
-                self.left._search_nn_dist(point, dist, results, get_dist)
-        if point[self.axis] >= split_plane - dist:
-            if self.right is not None:
-                self.right._search_nn_dist(point, dist, results, get_dist)
+            # Search the sides of the splitting plane that may be in range.
+            # Push right first, so the left side is searched first.
+            if point[node.axis] >= split_plane - dist:
+                if node.right is not None:
+                    stack.append(node.right)
+            if point[node.axis] <= split_plane + dist:
+                if node.left is not None:
+                    stack.append(node.left)
 
 
     @require_axis
@@ -551,16 +703,14 @@ class KDNode(Node):
 
         It is valid if each node splits correctly """
 
-        if not self:
-            return True
-
-        if self.left and self.data[self.axis] < self.left.data[self.axis]:
-            return False
+        for node in self.preorder():
+            if node.left and node.data[node.axis] < node.left.data[node.axis]:
+                return False
 
-        if self.right and self.data[self.axis] > self.right.data[self.axis]:
-            return False
+            if node.right and node.data[node.axis] > node.right.data[node.axis]:
+                return False
 
-        return all(c.is_valid() for c, _ in self.children) or self.is_leaf
+        return True
 
 
     def extreme_child(self, sel_func, axis):
@@ -569,22 +719,47 @@ class KDNode(Node):
         The child is selected by sel_func which is either min or max
         (or a different function with similar semantics). """
 
-        max_key = lambda child_parent: child_parent[0].data[axis]
+        path = self._extreme_path(sel_func, axis)
+        if not path:
+            return None, None
+
+        return path[-1], path[-2] if len(path) > 1 else None
+
 
+    def _extreme_path(self, sel_func, axis):
+        """ Returns the path from the current node to the child selected by
+        extreme_child, or an empty list if the subtree is empty """
 
-        # we don't know our parent, so we include None
-        me = [(self, None)] if self else []
+        max_key = lambda node: node.data[axis]
 
-        child_max = [c.extreme_child(sel_func, axis) for c, _ in self.children]
-        # insert self for unknown parents
-        child_max = [(c, p if p is not None else self) for c, p in child_max]
+        # Nodes that split on axis have smaller values on the left and larger
+        # ones on the right, so for min and max only one side needs to be
+        # searched.
+        skip = {min: 1, max: 0}.get(sel_func)
 
-        candidates =  me + child_max
+        # Collect candidates in preorder, remembering their parents so the
+        # path can be found.  We don't know our parent, so we include None.
+        candidates = []
+        parents = {}
+        stack = [(self, None)] if self else []
+        while stack:
+            node, parent = stack.pop()
+            candidates.append(node)
+            parents[id(node)] = parent
+            for c, pos in reversed(list(node.children)):
+                if node.axis == axis and pos == skip:
+                    continue
+                stack.append((c, node))
 
         if not candidates:
-            return None, None
+            return []
 
-        return sel_func(candidates, key=max_key)
+        node = sel_func(candidates, key=max_key)
+        path = []
+        while node is not None:
+            path.append(node)
+            node = parents[id(node)]
+        return path[::-1]
 
 
 
@@ -615,14 +790,24 @@ def create(point_list=None, dimensions=None, axis=0, sel_axis=None):
     if not point_list:
         return KDNode(sel_axis=sel_axis, axis=axis, dimensions=dimensions)
 
-    # Sort point list and choose median as pivot element
+    # If every point has the same value on this axis, splitting on it doesn't
+    # separate anything, and searches would have to visit both sides.  This
+    # happens with planar or collinear points.  Move on to an axis that the
+    # points are spread out on, if there is one.
     point_list = list(point_list)
+    for _ in range(dimensions):
+        first = point_list[0][axis]
+        if any(point[axis] != first for point in point_list):
+            break
+        axis = sel_axis(axis)
+
+    # Sort point list and choose median as pivot element
     point_list.sort(key=lambda point: point[axis])
     median = len(point_list) // 2
 
     loc   = point_list[median]
-    left  = create(point_list[:median], dimensions, sel_axis(axis))
-    right = create(point_list[median + 1:], dimensions, sel_axis(axis))
+    left  = create(point_list[:median], dimensions, sel_axis(axis), sel_axis)
+    right = create(point_list[median + 1:], dimensions, sel_axis(axis), sel_axis)
     return KDNode(loc, left, right, axis=axis, sel_axis=sel_axis, dimensions=dimensions)
 
 
@@ -0,0 +1,162 @@
+# A persistent on-disk cache of array_kdtree.KDTree indexes.
+#
+# The same base meshes are often mapped many times, by different tools and in different
+# sessions.  This saves each tree to disk, keyed by a hash of its points, and memory maps
+# it back in later, so a tree for an unchanged mesh doesn't need to be rebuilt and its
+# pages are shared between processes.
+#
+# cache = kdtree_cache.KDTreeCache()
+# tree = cache.get_tree(points)
+import errno, hashlib, logging, os, shutil, tempfile, time
+import numpy as np
+from zMayaTools import array_kdtree, util
+
+# This doesn't depend on Maya, so use the zMayaTools logger directly rather than through
+# maya_logging.  It'll still go to Maya's log handler if we're in Maya.
+log = logging.getLogger('zMayaTools')
+
+# Increase this if the saved format changes, so old entries aren't loaded.
+_cache_version = 1
+
+def get_default_cache_path():
+    """
+    Return the default cache directory.
+
+    This is in the Maya user directory if we're running in Maya, otherwise in the temporary
+    directory.
+    """
+    base_path = os.environ.get('MAYA_APP_DIR') or tempfile.gettempdir()
+    return os.path.join(base_path, 'zMayaTools', 'cache', 'kdtree')
+
+def get_points_key(points, leaf_size=16):
+    """
+    Return the cache key for a tree of points.
+
+    This is a hash of the point count and positions, so any change to the points gives a
+    different key.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    hasher = hashlib.sha1()
+    hasher.update(('%i %i %i %i' % (_cache_version, leaf_size, points.shape[0], points.shape[1])).encode('ascii'))
+    hasher.update(points.tobytes())
+    return hasher.hexdigest()
+
+class KDTreeCache(object):
+    def __init__(self, path=None, max_size=1024*1024*1024, max_age=60*60*24*30):
+        """
+        path is the cache directory, defaulting to get_default_cache_path().
+
+        Entries that haven't been used for max_age seconds are evicted, and the oldest entries
+        are evicted when the cache grows beyond max_size bytes.  Either limit can be None
+        to disable it.
+        """
+        self.path = path or get_default_cache_path()
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def get_tree(self, points, leaf_size=16):
+        """
+        Return a KDTree for points, loading it from the cache if possible.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        key = get_points_key(points, leaf_size)
+        entry_path = os.path.join(self.path, key)
+
+        if os.path.isdir(entry_path):
+            try:
+                tree = array_kdtree.KDTree.load(entry_path)
+            except (IOError, OSError, ValueError) as e:
+                # The entry is damaged, probably from being partially deleted.  Discard it and
+                # build it again.
+                log.warning('Discarding bad kd-tree cache entry %s: %s', entry_path, e)
+                shutil.rmtree(entry_path, ignore_errors=True)
+            else:
+                # Update the modification time, so eviction treats this as recently used.
+                os.utime(entry_path, None)
+                return tree
+
+        tree = array_kdtree.KDTree(points, leaf_size=leaf_size)
+        try:
+            self._save(tree, entry_path)
+        except (IOError, OSError) as e:
+            # Failing to write the cache isn't fatal.  Just return the tree we built.
+            log.warning('Couldn\'t write kd-tree cache entry %s: %s', entry_path, e)
+            return tree
+
+        self.evict(keep=entry_path)
+
+        # Return the memory mapped copy rather than the one we built, so the memory for the
+        # built tree can be freed and the pages are shared with other processes.
+        return array_kdtree.KDTree.load(entry_path)
+
+    def _save(self, tree, entry_path):
+        # Save to a temporary directory and rename it into place, so other processes never
+        # see a partially written entry.
+        util.mkdir_p(self.path)
+        temp_path = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            tree.save(temp_path)
+            try:
+                os.rename(temp_path, entry_path)
+            except OSError:
+                # Another process may have saved the same entry first, which is fine.
+                if not os.path.isdir(entry_path):
+                    raise
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def _get_entries(self):
+        """
+        Return a list of (path, last used time, size) for each cache entry.
+        """
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+
+            entry_path = os.path.join(self.path, name)
+            try:
+                mtime = os.stat(entry_path).st_mtime
+                size = sum(os.path.getsize(os.path.join(entry_path, fn)) for fn in os.listdir(entry_path))
+            except OSError as e:
+                # The entry was probably deleted by another process.
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            entries.append((entry_path, mtime, size))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Delete entries that are too old, then delete the least recently used entries until
+        the cache is within its size limit.
+
+        If keep is the path to an entry, it won't be deleted.
+        """
+        entries = sorted(self._get_entries(), key=lambda entry: entry[1])
+        now = time.time()
+
+        total_size = sum(size for path, mtime, size in entries)
+        for entry_path, mtime, size in entries:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_size is not None and total_size > self.max_size
+            if not too_old and not too_big:
+                continue
+            if entry_path == keep:
+                continue
+
+            # On Windows, this can fail if another process has the entry mapped.  Leave it
+            # for next time.
+            shutil.rmtree(entry_path, ignore_errors=True)
+            if not os.path.exists(entry_path):
+                total_size -= size
+
+    def clear(self):
+        """
+        Delete all cache entries.
+        """
+        for entry_path, mtime, size in self._get_entries():
+            shutil.rmtree(entry_path, ignore_errors=True)
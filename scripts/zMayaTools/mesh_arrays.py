@@ -0,0 +1,138 @@
+# Read mesh data into NumPy arrays.
+#
+# Reading vertex positions with cmds.xform gives a flat list of Python floats, which is
+# slow and uses a lot of memory for large meshes.  This reads the mesh's point buffer
+# directly, and transforms it to world space with NumPy, so no Python object is created
+# per vertex.
+#
+# Functions here take a mesh adapter, which is anything with:
+#
+# - get_points(): an (N,3) array of object space vertex positions
+# - get_world_matrix(): the mesh's 4x4 world matrix, in Maya's row-vector order
+# - get_face_vertices(): the mesh's topology, as (face vertex counts, face vertex indices)
+#   arrays in the same form as MFnMesh.getVertices
+#
+# MayaMesh reads these from a mesh in the scene, and ArrayMesh holds them directly, so
+# code using this can run and be tested without Maya.  This module only imports Maya when
+# a MayaMesh is used.
+import ctypes
+import numpy as np
+
+class ArrayMesh(object):
+    """
+    A mesh adapter holding its data in arrays.
+    """
+    def __init__(self, points, world_matrix=None, face_counts=None, face_connects=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.world_matrix = np.identity(4) if world_matrix is None else np.asarray(world_matrix, dtype=np.float64)
+        self.face_counts = np.asarray(face_counts if face_counts is not None else [], dtype=np.int32)
+        self.face_connects = np.asarray(face_connects if face_connects is not None else [], dtype=np.int32)
+
+    def get_points(self):
+        return self.points
+
+    def get_world_matrix(self):
+        return self.world_matrix
+
+    def get_face_vertices(self):
+        return self.face_counts, self.face_connects
+
+class MayaMesh(object):
+    """
+    A mesh adapter reading from a mesh in the Maya scene.
+    """
+    def __init__(self, shape):
+        from maya import OpenMaya as om
+
+        selection_list = om.MSelectionList()
+        selection_list.add(str(shape))
+        self.dag_path = om.MDagPath()
+        selection_list.getDagPath(0, self.dag_path)
+        if self.dag_path.apiType() == om.MFn.kTransform:
+            self.dag_path.extendToShape()
+
+    def get_points(self):
+        from maya import OpenMaya as om
+
+        # getRawPoints gives us a pointer to the mesh's own float buffer.  Wrap it in an array
+        # and copy it, since the buffer belongs to the mesh and may change or be freed.
+        mesh = om.MFnMesh(self.dag_path)
+        count = mesh.numVertices()
+        if not count:
+            return np.zeros((0, 3), dtype=np.float32)
+
+        ptr = mesh.getRawPoints()
+        buf = (ctypes.c_float * (count * 3)).from_address(int(ptr))
+        return np.ctypeslib.as_array(buf).reshape(count, 3).copy()
+
+    def get_world_matrix(self):
+        matrix = self.dag_path.inclusiveMatrix()
+        return np.array([[matrix(row, col) for col in range(4)] for row in range(4)], dtype=np.float64)
+
+    def get_face_vertices(self):
+        # The API 2 MIntArray can be iterated directly, which is much faster than indexing
+        # API 1 arrays one element at a time.
+        from maya.api import OpenMaya as om2
+
+        selection_list = om2.MSelectionList()
+        selection_list.add(self.dag_path.fullPathName())
+        mesh = om2.MFnMesh(selection_list.getDagPath(0))
+        counts, connects = mesh.getVertices()
+        counts = np.fromiter(counts, dtype=np.int32, count=len(counts))
+        connects = np.fromiter(connects, dtype=np.int32, count=len(connects))
+        return counts, connects
+
+    def get_handle(self):
+        """
+        Return an MObjectHandle for the mesh node, to recognize it later.
+        """
+        from maya import OpenMaya as om
+        return om.MObjectHandle(self.dag_path.node())
+
+    def add_change_callbacks(self, func):
+        """
+        Call func whenever the mesh's points, topology or world transform may have changed.
+
+        This watches for the mesh or any of its parents being dirtied.  Return a registered
+        maya_callbacks.MayaCallbackList, which can be unregistered to stop watching.
+        """
+        from maya import OpenMaya as om
+        from zMayaTools import maya_callbacks
+
+        callbacks = maya_callbacks.MayaCallbackList()
+        callbacks.registered = True
+
+        path = om.MDagPath(self.dag_path)
+        while True:
+            node = path.node()
+            callbacks.add(func, lambda cb, node=node: om.MNodeMessage.addNodeDirtyCallback(node, cb, None), asyn=False)
+            if path.length() <= 1:
+                break
+            path.pop()
+
+        return callbacks
+
+def get_mesh(mesh):
+    """
+    Return a mesh adapter for mesh.
+
+    If mesh is already an adapter, it's returned unchanged.  Otherwise, it's the name of
+    a mesh in the scene, or a PyMEL node.
+    """
+    if hasattr(mesh, 'get_points'):
+        return mesh
+    return MayaMesh(mesh)
+
+def get_world_points(mesh):
+    """
+    Return the world space vertex positions of mesh as an (N,3) array.
+
+    mesh is anything get_mesh accepts.
+    """
+    mesh = get_mesh(mesh)
+    points = np.asarray(mesh.get_points(), dtype=np.float64)
+    matrix = mesh.get_world_matrix()
+
+    # Maya matrices transform row vectors, with the translation in the bottom row.  Meshes
+    # don't have projective transforms, so the last column is ignored.
+    return np.dot(points, matrix[:3,:3]) + matrix[3,:3]
@@ -0,0 +1,196 @@
+# Mesh topology helpers working on face arrays.
+#
+# Meshes are given as face vertex counts and face vertex indices, in the same form as
+# MFnMesh.getVertices and mesh_arrays adapters' get_face_vertices, so these don't depend
+# on Maya.
+#
+# Connectivity is handled as half-edges: each face has a half-edge from each of its
+# vertices to the next one, so half-edge h is face_connects[h] -> face_connects[next[h]].
+# Faces are consistently wound, so the half-edge across an edge goes the other way.
+import numpy as np
+
+class HalfEdges(object):
+    """
+    Half-edge connectivity for a mesh.
+
+    All arrays are indexed by half-edge:
+
+    - vertex: the vertex the half-edge starts at
+    - face: the face the half-edge belongs to
+    - next, prev: the next and previous half-edges around the face
+    - opposite: the half-edge going the other way across the same edge, or -1 on boundaries
+    """
+    def __init__(self, face_counts, face_connects, vertex_count=None):
+        face_counts = np.asarray(face_counts, dtype=np.intp)
+        face_connects = np.asarray(face_connects, dtype=np.intp)
+        if face_counts.sum() != len(face_connects):
+            raise ValueError('face_counts doesn\'t match the length of face_connects')
+
+        if vertex_count is None:
+            vertex_count = int(face_connects.max()) + 1 if len(face_connects) else 0
+        self.vertex_count = vertex_count
+        self.face_counts = face_counts
+
+        count = len(face_connects)
+        self.face_start = np.cumsum(face_counts) - face_counts
+        self.face = np.repeat(np.arange(len(face_counts)), face_counts)
+        local = np.arange(count) - self.face_start[self.face]
+        size = face_counts[self.face]
+        self.vertex = face_connects
+        self.next = self.face_start[self.face] + (local + 1) % size
+        self.prev = self.face_start[self.face] + (local - 1) % size
+
+        # Find the opposite of each half-edge by looking up its reversed key.
+        keys = self.vertex * vertex_count + self.vertex[self.next]
+        reversed_keys = self.vertex[self.next] * vertex_count + self.vertex
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        slot = np.searchsorted(sorted_keys, reversed_keys)
+        slot[slot == count] = 0
+        found = sorted_keys[slot] == reversed_keys if count else np.zeros(0, dtype=bool)
+        self.opposite = np.where(found, order[slot], -1)
+
+    def __len__(self):
+        return len(self.vertex)
+
+    def find(self, from_vertex, to_vertex):
+        """
+        Return the half-edge from from_vertex to to_vertex, or -1 if there isn't one.
+        """
+        matches = np.flatnonzero((self.vertex == from_vertex) & (self.vertex[self.next] == to_vertex))
+        return int(matches[0]) if len(matches) else -1
+
+def make_topological_symmetry_map(face_counts, face_connects, seam_edge=None, vertex_pair=None, vertex_count=None):
+    """
+    Find the mirrored vertex of every vertex on a symmetric mesh using only its topology,
+    so it works on posed or slightly asymmetric meshes.
+
+    The symmetry is given by either:
+
+    - seam_edge: a (vertex, vertex) edge on the line of symmetry
+    - vertex_pair: a (vertex, mirrored vertex) pair.  This is ambiguous if the mesh has
+      more than one topological symmetry, and the first one found is used.  A seam edge
+      should be used if possible.
+
+    The mesh is walked outwards from there, a face at a time on both sides, in O(V+E).
+
+    Return an array with the mirrored vertex of each vertex.  Vertices on the seam are
+    mirrored to themselves, and vertices that weren't reached, such as those in other
+    shells, are -1.
+
+    Raise ValueError if the mesh isn't topologically symmetric.
+    """
+    if (seam_edge is None) == (vertex_pair is None):
+        raise ValueError('Exactly one of seam_edge and vertex_pair must be given')
+
+    half_edges = HalfEdges(face_counts, face_connects, vertex_count)
+
+    if seam_edge is not None:
+        # A half-edge along the seam mirrors to the half-edge going the other way across it.
+        first, second = seam_edge
+        start = half_edges.find(first, second)
+        if start == -1:
+            start = half_edges.find(second, first)
+        if start == -1:
+            raise ValueError('%i and %i aren\'t connected by an edge' % (first, second))
+        if half_edges.opposite[start] == -1:
+            raise ValueError('The seam edge is on a border, so the mesh can\'t be symmetric around it')
+        return _walk_symmetry(half_edges, start, int(half_edges.opposite[start]))
+
+    # Try each way the edges around the two vertices could be mirrored onto each other,
+    # and use the first one that works.
+    vertex, mirrored_vertex = vertex_pair
+    starts = np.flatnonzero(half_edges.vertex == vertex)
+    mirrored_starts = np.flatnonzero(half_edges.vertex[half_edges.next] == mirrored_vertex)
+    for start in starts:
+        for mirrored_start in mirrored_starts:
+            try:
+                return _walk_symmetry(half_edges, int(start), int(mirrored_start))
+            except ValueError:
+                pass
+
+    raise ValueError('The mesh isn\'t topologically symmetric around vertices %i and %i' % (vertex, mirrored_vertex))
+
+def _walk_symmetry(half_edges, start, mirrored_start):
+    """
+    Walk the mesh, starting with half-edge start mirroring onto mirrored_start.
+
+    A half-edge a->b mirrors onto a half-edge b'->a', since mirroring reverses winding.  Going
+    forwards around a face on one side goes backwards around its mirrored face.
+    """
+    # Work with lists, since we're accessing them one element at a time.
+    vertex = half_edges.vertex.tolist()
+    face = half_edges.face.tolist()
+    next_edge = half_edges.next.tolist()
+    prev_edge = half_edges.prev.tolist()
+    opposite = half_edges.opposite.tolist()
+    face_counts = half_edges.face_counts.tolist()
+
+    mirror = [-1] * half_edges.vertex_count
+    face_mirror = [-1] * len(face_counts)
+
+    def set_mirror(v, mirrored):
+        for a, b in ((v, mirrored), (mirrored, v)):
+            if mirror[a] == -1:
+                mirror[a] = b
+            elif mirror[a] != b:
+                raise ValueError('The mesh isn\'t topologically symmetric: vertex %i mirrors to both %i and %i' % (a, mirror[a], b))
+
+    queue = [(start, mirrored_start)]
+    face_mirror[face[start]] = face[mirrored_start]
+    face_mirror[face[mirrored_start]] = face[start]
+
+    # queue is appended to while we iterate over it, giving a breadth-first walk.
+    for edge, mirrored_edge in queue:
+        count = face_counts[face[edge]]
+        if face_counts[face[mirrored_edge]] != count:
+            raise ValueError('The mesh isn\'t topologically symmetric: faces %i and %i have different vertex counts' % (face[edge], face[mirrored_edge]))
+
+        for _ in range(count):
+            # edge starts at the vertex mirrored_edge ends at.
+            set_mirror(vertex[edge], vertex[next_edge[mirrored_edge]])
+
+            across = opposite[edge]
+            mirrored_across = opposite[mirrored_edge]
+            if (across == -1) != (mirrored_across == -1):
+                raise ValueError('The mesh isn\'t topologically symmetric: border edges don\'t match')
+
+            if across != -1:
+                across_face = face[across]
+                mirrored_across_face = face[mirrored_across]
+                if face_mirror[across_face] == -1 and face_mirror[mirrored_across_face] == -1:
+                    face_mirror[across_face] = mirrored_across_face
+                    face_mirror[mirrored_across_face] = across_face
+                    queue.append((across, mirrored_across))
+                elif face_mirror[across_face] != mirrored_across_face:
+                    raise ValueError('The mesh isn\'t topologically symmetric: face %i mirrors to both %i and %i' % (
+                        across_face, face_mirror[across_face], mirrored_across_face))
+
+            edge = next_edge[edge]
+            mirrored_edge = prev_edge[mirrored_edge]
+
+    return np.array(mirror, dtype=np.intp)
+
+def triangulate(face_counts, face_connects):
+    """
+    Split each face into a fan of triangles around its first vertex.
+
+    Return ((T,3) triangle vertex indices, (T,) face index of each triangle).  This is exact
+    for triangles, quads and other convex faces.
+    """
+    face_counts = np.asarray(face_counts, dtype=np.intp)
+    face_connects = np.asarray(face_connects, dtype=np.intp)
+    face_start = np.cumsum(face_counts) - face_counts
+
+    # Each face with n vertices gives n-2 triangles: (0, i, i+1) for i in 1..n-2.
+    tri_counts = np.maximum(face_counts - 2, 0)
+    tri_face = np.repeat(np.arange(len(face_counts)), tri_counts)
+    tri_local = np.arange(tri_counts.sum()) - np.repeat(np.cumsum(tri_counts) - tri_counts, tri_counts) + 1
+
+    first = face_start[tri_face]
+    triangles = np.stack([
+        face_connects[first],
+        face_connects[first + tri_local],
+        face_connects[first + tri_local + 1],
+    ], axis=1)
+    return triangles, tri_face
@@ -0,0 +1,175 @@
+# Match points against each other within a threshold.
+#
+# This is the core of vertex_mapping.  It works on plain arrays of points and doesn't
+# depend on Maya, so it can run in mayapy or plain CPython, including in worker processes.
+import math, os, shutil, sys, tempfile
+import numpy as np
+from zMayaTools import array_kdtree, hash_grid
+
+def make_spatial_index(points, threshold, method='kdtree', cache=None):
+    """
+    Create a spatial index for matching points within threshold.
+
+    If method is 'kdtree', use a kd-tree.  If it's 'grid', use a hash grid, which is faster
+    for matching meshes with identical topology at a small threshold.  A grid needs a
+    nonzero threshold for its cell size, so with a threshold of 0, which only matches
+    identical points, a kd-tree is used instead.
+
+    If cache is a kdtree_cache.KDTreeCache, kd-trees are loaded from it if possible.
+    """
+    if method == 'kdtree':
+        if cache is not None:
+            return cache.get_tree(points)
+        return array_kdtree.KDTree(points)
+    elif method == 'grid':
+        if not threshold > 0:
+            return make_spatial_index(points, threshold, 'kdtree', cache)
+
+        # The threshold is compared against squared distances, so the search radius is
+        # its square root.
+        return hash_grid.HashGrid(points, cell_size=math.sqrt(threshold))
+    else:
+        raise ValueError('Unknown vertex mapping method: %s' % method)
+
+def match_points(src_points, dst_points, threshold, method='kdtree', cache=None, processes=None):
+    """
+    Find the closest point in src_points to each point in dst_points, ignoring matches
+    further away than threshold.  Like the spatial indexes, threshold is compared against
+    squared distances.
+
+    Return (indices, distances).  indices is the index in src_points matching each point in
+    dst_points, or -1 if it had no match.
+
+    method and cache are passed to make_spatial_index.
+
+    If processes is greater than 1, the destination points are split into shards and matched
+    in that many worker processes, sharing a temporary copy of the index on disk.  cache isn't
+    used in this case.  This is only worth it for very large meshes.  Worker processes need
+    Python 3.7 or newer, and on older versions the points are matched in this process.
+    """
+    if processes is not None and processes > 1 and len(dst_points) > 1 and _processes_supported():
+        return _match_points_in_processes(src_points, dst_points, threshold, method, processes)
+
+    index = make_spatial_index(src_points, threshold, method, cache)
+    return index.query(dst_points, max_distance=threshold)
+
+def interpolate_values(src_points, values, dst_points, k=4, radius=None, power=2, default=0, cache=None):
+    """
+    Interpolate values at src_points onto dst_points, by inverse distance weighting of the
+    k nearest source points.
+
+    values has a row for each source point, such as an (N,) array of weights or an (N,C)
+    array of colors or deltas.  Return an array with a row for each destination point.
+
+    Weights fall off with distance to the given power.  If radius is given, only source
+    points within radius are used, and their weights fade smoothly to zero at radius
+    (modified Shepard weighting).  Unlike threshold, radius isn't squared.  Destination
+    points with no source points in range get default.
+
+    If cache is a kdtree_cache.KDTreeCache, the source tree is loaded from it if possible.
+    """
+    values = np.asarray(values)
+    dst_points = np.asarray(dst_points, dtype=np.float64)
+    if len(values) != len(src_points):
+        raise ValueError('values must have a row for each source point')
+
+    if cache is not None:
+        tree = cache.get_tree(src_points)
+    else:
+        tree = array_kdtree.KDTree(src_points)
+
+    max_distance = None if radius is None else float(radius) * float(radius)
+    indices, distances = tree.query(dst_points, k=k, max_distance=max_distance)
+    indices = indices.reshape(len(dst_points), -1)
+    distances = np.sqrt(distances.reshape(len(dst_points), -1))
+
+    found = indices != -1
+    with np.errstate(divide='ignore'):
+        if radius is None:
+            weights = 1.0 / distances
+        else:
+            weights = np.maximum(radius - distances, 0) / (radius * distances)
+    weights = np.where(found, weights, 0) ** power
+
+    # A source point exactly on the destination point gets all of the weight.
+    exact = found & (distances == 0)
+    has_exact = exact.any(axis=1)
+    weights[has_exact] = exact[has_exact]
+
+    total = weights.sum(axis=1)
+    has_weight = total > 0
+    weights[has_weight] /= total[has_weight,np.newaxis]
+
+    result = np.einsum('ij,ij...->i...', weights, values[np.where(found, indices, 0)])
+    if not np.issubdtype(result.dtype, np.floating):
+        result = result.astype(np.float64)
+    result[~has_weight] = default
+    return result
+
+def _get_mayapy_path():
+    """
+    If we're running inside Maya, return the path to mayapy, otherwise None.
+
+    Worker processes are started by running sys.executable, which is Maya itself when
+    running inside Maya.  We need to start them with mayapy instead.
+    """
+    executable = os.path.splitext(os.path.basename(sys.executable))[0].lower()
+    if executable != 'maya' or 'MAYA_LOCATION' not in os.environ:
+        return None
+
+    mayapy = os.path.join(os.environ['MAYA_LOCATION'], 'bin', 'mayapy')
+    if os.name == 'nt':
+        mayapy += '.exe'
+    return mayapy
+
+# The spatial index in each worker process.  This is loaded once per worker by
+# _init_worker, rather than sent with every shard.
+_worker_index = None
+
+def _init_worker(index_path, threshold, method):
+    global _worker_index
+    if method == 'kdtree':
+        # The tree is memory mapped, so all workers share the same pages.
+        _worker_index = array_kdtree.KDTree.load(index_path)
+    else:
+        # Grids are cheap to build, so just build one from the source points.
+        points = np.load(os.path.join(index_path, 'points.npy'), mmap_mode='r')
+        _worker_index = make_spatial_index(points, threshold, method)
+
+def _match_shard(dst_points, threshold):
+    return _worker_index.query(dst_points, max_distance=threshold)
+
+def _processes_supported():
+    # Workers are started with concurrent.futures and a spawn context from
+    # multiprocessing.get_context, and ProcessPoolExecutor only takes mp_context in 3.7.
+    return sys.version_info >= (3, 7)
+
+def _match_points_in_processes(src_points, dst_points, threshold, method, processes):
+    import concurrent.futures, multiprocessing
+
+    # Write the source index to disk so workers can map it read-only, instead of each worker
+    # building its own or having it pickled to it.
+    index_path = tempfile.mkdtemp(prefix='zMayaTools-point-matching-')
+    try:
+        if method == 'kdtree':
+            make_spatial_index(src_points, threshold, method).save(index_path)
+        else:
+            np.save(os.path.join(index_path, 'points.npy'), np.asarray(src_points, dtype=np.float64))
+
+        # Always spawn workers rather than forking, since forking Maya isn't safe.
+        context = multiprocessing.get_context('spawn')
+        mayapy = _get_mayapy_path()
+        if mayapy is not None:
+            context.set_executable(mayapy)
+
+        # Use a few shards per process, so a slow shard doesn't leave the other workers idle.
+        shards = np.array_split(np.asarray(dst_points, dtype=np.float64), min(len(dst_points), processes * 4))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                initializer=_init_worker, initargs=(index_path, threshold, method)) as executor:
+            results = list(executor.map(_match_shard, shards, [threshold] * len(shards)))
+    finally:
+        shutil.rmtree(index_path, ignore_errors=True)
+
+    indices = np.concatenate([shard_indices for shard_indices, shard_distances in results])
+    distances = np.concatenate([shard_distances for shard_indices, shard_distances in results])
+    return indices, distances
@@ -1,7 +1,27 @@
 #!/usr/bin/python
-import math 
+import collections, math, warnings
 from pprint import pprint
 
+# NumPy is optional.  If it's available, kernel matrices are built and solved with it,
+# otherwise we fall back on the pure Python solver below.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# If SciPy is available too, its triangular solver is used, and sparse kernel matrices are
+# solved with its sparse LU.
+try:
+    import scipy.linalg as scipy_linalg
+except ImportError:
+    scipy_linalg = None
+
+try:
+    import scipy.sparse as scipy_sparse
+    import scipy.sparse.linalg
+except ImportError:
+    scipy_sparse = None
+
 
 #def cholesky(L):
 #    L = [[0] * len(L) for _ in range(len(L))]
@@ -124,13 +144,8 @@ def solve(A, b):
     """
     Solve Ab=x for b, where A is a matrix and b is a vector.
     """
-    print_matrix(A)
     upper = Cholesky(A)
-    # print 'upper'
-    # print_matrix(upper)
     lower = transpose(upper)
-    # print 'lower'
-    # print_matrix(lower)
     values = forward_solve(lower, b)
     return backtrack_solve(upper, values)
 
@@ -157,19 +172,450 @@ def mult(lhs, rhs):
             result[c][d] = s
     return result
 
-def print_matrix(m):
-    for row in m:
-        for col in row:
-            print('%5.1f' % col)
+class PythonFactorization(object):
+    """
+    The pure Python Cholesky factorization of a kernel matrix X.
+
+    If X isn't positive definite, like the linear kernel's, Cholesky can't factor it directly.
+    If normal_equations is true, this factors the normal equations XtX instead.
+    """
+    def __init__(self, X, normal_equations=False):
+        self.Xt = transpose(X) if normal_equations else None
+        self.upper = Cholesky(mult(self.Xt, X) if normal_equations else X)
+        self.lower = transpose(self.upper)
+
+    def solve(self, b):
+        """
+        Solve Xx=b for x, where b is a vector.
+        """
+        if self.Xt is not None:
+            b = dot(self.Xt, b)
+        values = forward_solve(self.lower, b)
+        return backtrack_solve(self.upper, values)
+
+class SymmetricFactorization(object):
+    """
+    The NumPy factorization of a symmetric matrix A, to solve it for any number of right-hand
+    sides without factoring it again.
+
+    Positive definite matrices, like the Gaussian kernel's, are factored with Cholesky.
+    Others, like the linear kernel's, which has a zero diagonal, are factored with LU if
+    SciPy is available.  Without SciPy, NumPy can't keep an LU factorization, so these are
+    solved with np.linalg.solve each time.
+
+    Raise SolveFailedError if the matrix is singular.
+
+    insert() and remove() return the factorization with a row and column added or removed
+    in O(n^2), instead of factoring the new matrix from scratch in O(n^3).  For matrices
+    that aren't positive definite, this updates the inverse, which is computed the first
+    time it's needed.  Solving with an updated inverse is followed by a step of iterative
+    refinement against the matrix, so it's about as accurate as solving with LU.
+    """
+    # Rounding errors build up a little with each update, so after this many, updating
+    # fails and the matrix should be factored from scratch.
+    max_updates = 32
+
+    # Updates fail if a pivot shrinks below this fraction of its original value, which
+    # means the updated matrix is close to singular and precision would be lost.
+    update_tolerance = 1e-8
+
+    # The number of updates since the matrix was factored from scratch.
+    updates = 0
+
+    # This is true if the factorization was updated from an earlier one.
+    incremental = False
+
+    def __init__(self, A):
+        A = np.asarray(A, dtype=np.float64)
+        self.lower = None
+        self.matrix = None
+        self.lu = None
+        self.inverse = None
+
+        try:
+            self.lower = np.linalg.cholesky(A)
+            return
+        except np.linalg.LinAlgError:
+            pass
+
+        self.matrix = A
+        if scipy_linalg is not None:
+            # lu_factor warns about singular matrices instead of raising an error.
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                self.lu = scipy_linalg.lu_factor(A, check_finite=False)
+            if not np.all(np.diag(self.lu[0])):
+                raise SolveFailedError('Matrix is singular')
+
+    def __len__(self):
+        return len(self.lower if self.lower is not None else self.matrix)
+
+    @classmethod
+    def _updated(cls, factorization, lower=None, matrix=None, inverse=None):
+        result = cls.__new__(cls)
+        result.lower = lower
+        result.matrix = matrix
+        result.lu = None
+        result.inverse = inverse
+        result.updates = factorization.updates + 1
+        result.incremental = True
+        return result
+
+    def _get_inverse(self):
+        if self.inverse is None:
+            try:
+                self.inverse = self._solve_matrix(np.eye(len(self)))
+            except np.linalg.LinAlgError:
+                raise SolveFailedError('Matrix is singular')
+        return self.inverse
+
+    def _solve_matrix(self, b):
+        if self.lu is not None:
+            return scipy_linalg.lu_solve(self.lu, b, check_finite=False)
+
+        if self.inverse is not None:
+            # Refine the result once, to recover most of the precision lost by multiplying
+            # by the inverse.
+            x = np.dot(self.inverse, b)
+            return x + np.dot(self.inverse, b - np.dot(self.matrix, x))
+
+        return np.linalg.solve(self.matrix, b)
+
+    def solve(self, b):
+        """
+        Solve Ax=b for x, where b is a vector, or a matrix with a column for each right-hand
+        side.
+        """
+        b = np.asarray(b, dtype=np.float64)
+        if self.lower is not None:
+            x = solve_triangular(self.lower.T, solve_triangular(self.lower, b, lower=True), lower=False)
+        else:
+            try:
+                x = self._solve_matrix(b)
+            except np.linalg.LinAlgError:
+                raise SolveFailedError('Matrix is singular')
+
+        # A nearly singular matrix may not raise an error, but gives a meaningless result.
+        if not np.all(np.isfinite(x)):
+            raise SolveFailedError('Matrix is singular')
+        return x
+
+    def insert(self, index, column):
+        """
+        Return the factorization of A with a row and column inserted at index.
+
+        column is the new column of the updated matrix, including its diagonal element at
+        index.  Raise SolveFailedError if the update would lose precision, in which case the
+        new matrix should be factored from scratch.
+        """
+        self._check_update()
+        column = np.asarray(column, dtype=np.float64)
+        k1 = column[:index]
+        diagonal = column[index]
+        k3 = column[index+1:]
+
+        if self.lower is not None:
+            # With L = [[L11, 0], [L31, L33]], the new factor is:
+            #
+            # [[L11,  0, 0   ],
+            #  [l21t, d, 0   ],
+            #  [L31,  l32, L33']]
+            #
+            # where L11 l21 = k1, d = sqrt(c - l21.l21), l32 = (k3 - L31 l21) / d, and
+            # L33' L33't = L33 L33t - l32 l32t.
+            L = self.lower
+            l21 = solve_triangular(L[:index,:index], k1, lower=True)
+            d2 = diagonal - np.dot(l21, l21)
+            if not d2 > self.update_tolerance * abs(diagonal):
+                raise SolveFailedError('Matrix is no longer positive definite')
+            d = math.sqrt(d2)
+            l32 = (k3 - np.dot(L[index:,:index], l21)) / d
+
+            lower = np.zeros((len(L) + 1, len(L) + 1))
+            lower[:index,:index] = L[:index,:index]
+            lower[index,:index] = l21
+            lower[index,index] = d
+            lower[index+1:,:index] = L[index:,:index]
+            lower[index+1:,index] = l32
+            lower[index+1:,index+1:] = cholesky_update(L[index:,index:], l32, downdate=True,
+                    tolerance=self.update_tolerance)
+            return self._updated(self, lower=lower)
+
+        # Insert at the end by blocks with the Schur complement s = c - kt A^-1 k, then move
+        # the new row and column into place.
+        A_inv = self._get_inverse()
+        k = np.concatenate([k1, k3])
+        A_inv_k = np.dot(A_inv, k)
+        schur = diagonal - np.dot(k, A_inv_k)
+        if not abs(schur) > self.update_tolerance * max(abs(diagonal), np.abs(k).max()):
+            raise SolveFailedError('Matrix is singular')
+
+        n = len(A_inv)
+        inverse = np.empty((n + 1, n + 1))
+        inverse[:n,:n] = A_inv + np.outer(A_inv_k, A_inv_k) / schur
+        inverse[:n,n] = -A_inv_k / schur
+        inverse[n,:n] = -A_inv_k / schur
+        inverse[n,n] = 1.0 / schur
+
+        matrix = np.empty((n + 1, n + 1))
+        matrix[:n,:n] = self.matrix
+        matrix[:n,n] = k
+        matrix[n,:n] = k
+        matrix[n,n] = diagonal
+
+        order = np.concatenate([np.arange(index), [n], np.arange(index, n)])
+        return self._updated(self, matrix=matrix[np.ix_(order, order)], inverse=inverse[np.ix_(order, order)])
+
+    def remove(self, index):
+        """
+        Return the factorization of A with the row and column at index removed.
+
+        Raise SolveFailedError if the update would lose precision, in which case the new
+        matrix should be factored from scratch.
+        """
+        self._check_update()
+        keep = np.concatenate([np.arange(index), np.arange(index + 1, len(self))])
+
+        if self.lower is not None:
+            # Removing row and column i from [[L11, 0, 0], [l21t, l22, 0], [L31, l32, L33]]
+            # leaves [[L11, 0], [L31, L33']], where L33' L33't = L33 L33t + l32 l32t.
+            L = self.lower
+            lower = L[np.ix_(keep, keep)]
+            lower[index:,index:] = cholesky_update(L[index+1:,index+1:], L[index+1:,index],
+                    tolerance=self.update_tolerance)
+            return self._updated(self, lower=lower)
+
+        # With B = A^-1, removing row and column i from A gives B11 - b12 b12t / b22.
+        B = self._get_inverse()
+        b22 = B[index,index]
+        if not abs(b22) > self.update_tolerance * np.abs(B[index]).max():
+            raise SolveFailedError('Matrix is singular')
+        b12 = B[keep,index]
+        inverse = B[np.ix_(keep, keep)] - np.outer(b12, b12) / b22
+        return self._updated(self, matrix=self.matrix[np.ix_(keep, keep)], inverse=inverse)
+
+    def _check_update(self):
+        if self.updates >= self.max_updates:
+            raise SolveFailedError('Too many updates')
+
+def cholesky_update(L, x, downdate=False, tolerance=0):
+    """
+    Given the lower Cholesky factor L of a matrix A, return the factor of A + x xt, or
+    A - x xt if downdate is true, in O(n^2).
+
+    Raise SolveFailedError if a downdate would make the matrix indefinite, or shrink a pivot
+    below tolerance times its original value.
+    """
+    L = np.array(L, dtype=np.float64)
+    x = np.array(x, dtype=np.float64)
+    sign = -1 if downdate else 1
+    for k in range(len(x)):
+        pivot = L[k,k]
+        r2 = pivot*pivot + sign * x[k]*x[k]
+        if not r2 > tolerance * pivot*pivot:
+            raise SolveFailedError('Matrix is no longer positive definite')
+
+        r = math.sqrt(r2)
+        c = r / pivot
+        s = x[k] / pivot
+        L[k,k] = r
+        L[k+1:,k] = (L[k+1:,k] + sign * s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * L[k+1:,k]
+    return L
+
+def find_sample_change(old_points, new_points):
+    """
+    Compare two (N,D) arrays of sample positions.
+
+    Return ('add', index), ('remove', index) or ('move', index) if new_points is old_points
+    with a single sample added, removed or moved.  Otherwise, return None.
+    """
+    if old_points.shape[1:] != new_points.shape[1:]:
+        return None
+
+    if len(old_points) == len(new_points):
+        differs = np.flatnonzero(np.any(old_points != new_points, axis=1))
+        return ('move', int(differs[0])) if len(differs) == 1 else None
+
+    if abs(len(old_points) - len(new_points)) != 1:
+        return None
+
+    # Find the first position that differs.  Everything after it should be shifted by one.
+    shorter, longer = sorted([old_points, new_points], key=len)
+    differs = np.flatnonzero(np.any(shorter != longer[:len(shorter)], axis=1))
+    index = int(differs[0]) if len(differs) else len(shorter)
+    if not np.array_equal(shorter[index:], longer[index+1:]):
+        return None
+
+    return ('add' if longer is new_points else 'remove'), index
+
+class SparseFactorization(object):
+    """
+    The sparse LU factorization of a sparse symmetric matrix, from SciPy's SuperLU.
+
+    Raise SolveFailedError if the matrix is singular.
+    """
+    incremental = False
+
+    def __init__(self, A):
+        try:
+            self.lu = scipy_sparse.linalg.splu(scipy_sparse.csc_matrix(A), permc_spec='MMD_AT_PLUS_A',
+                    diag_pivot_thresh=0, options={'SymmetricMode': True})
+        except RuntimeError:
+            raise SolveFailedError('Matrix is singular')
+
+    def solve(self, b):
+        x = self.lu.solve(np.asarray(b, dtype=np.float64))
+        if not np.all(np.isfinite(x)):
+            raise SolveFailedError('Matrix is singular')
+        return x
+
+    def insert(self, index, column):
+        raise SolveFailedError('Sparse factorizations can\'t be updated')
+
+    def remove(self, index):
+        raise SolveFailedError('Sparse factorizations can\'t be updated')
+
+def solve_triangular(A, b, lower):
+    """
+    Solve Ax=b for x with NumPy, where A is a lower or upper triangular matrix.
+
+    This is forward_solve and backtrack_solve for arrays.  It uses SciPy if it's available,
+    otherwise it substitutes a row at a time.
+    """
+    if scipy_linalg is not None:
+        return scipy_linalg.solve_triangular(A, b, lower=lower, check_finite=False)
+
+    x = np.array(b, dtype=np.float64)
+    rows = range(len(A)) if lower else reversed(range(len(A)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in rows:
+            if lower:
+                x[i] -= np.dot(A[i,:i], x[:i])
+            else:
+                x[i] -= np.dot(A[i,i+1:], x[i+1:])
+            x[i] /= A[i,i]
+    return x
+
+def solve_symmetric(A, b):
+    """
+    Solve Ax=b for x with NumPy, where A is a symmetric matrix and b is a vector, or a
+    matrix with a column for each right-hand side.
+
+    This solves the system directly, without forming the normal equations.  See
+    SymmetricFactorization.
+    """
+    return SymmetricFactorization(A).solve(b)
+
+class FactorizationCache(object):
+    """
+    Cached kernel matrix factorizations, keyed on sample positions and kernel parameters.
+
+    While sample values are being edited, the samples stay in the same place, so the
+    factorization of their kernel matrix can be reused, and only the substitution needs
+    to be redone.
+
+    full_solves counts solves that factored a matrix, partial_solves counts solves that
+    reused a cached factorization, and incremental_solves counts solves that updated an
+    earlier factorization, for profiling.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self.reset_counters()
+
+    def get(self, key, factor):
+        """
+        Return the factorization for key, calling factor() to create it if it isn't cached.
+
+        Matrices that can't be factored are remembered too, and raise SolveFailedError
+        again without retrying.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.partial_solves += 1
+        else:
+            try:
+                entry = factor()
+            except SolveFailedError as e:
+                entry = e
+
+            if getattr(entry, 'incremental', False):
+                self.incremental_solves += 1
+            else:
+                self.full_solves += 1
+
+        self._store(key, entry)
+        if isinstance(entry, SolveFailedError):
+            raise entry
+        return entry
+
+    def put(self, key, factorization):
+        """
+        Cache a factorization that's being reused from somewhere else, such as an earlier
+        RBF with the same samples whose entry was evicted, and return it.
+
+        This counts as a partial solve, since nothing was factored.
+        """
+        self._entries.pop(key, None)
+        self.partial_solves += 1
+        self._store(key, factorization)
+        return factorization
+
+    def _store(self, key, entry):
+        # Move the entry to the end, so the least recently used entry is evicted first.
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def reset_counters(self):
+        self.full_solves = 0
+        self.partial_solves = 0
+        self.incremental_solves = 0
+
+    def clear(self):
+        self._entries.clear()
+
+# The cache used by zRBF.
+factorization_cache = FactorizationCache()
+
+def squared_distances(a, b):
+    """
+    Return the squared distance between each of the points in a and b, as an array with
+    a row for each point in a and a column for each point in b.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+
+    # Sum one dimension at a time.  This avoids an (M,N,D) array, and is much faster than
+    # reducing one for small D.
+    result = np.zeros((len(a), len(b)))
+    for axis in range(a.shape[1]):
+        delta = np.subtract.outer(a[:,axis], b[:,axis])
+        delta *= delta
+        result += delta
+    return result
+
+# Kernels use NumPy for arrays and math for numbers, so the Python backend gets Python
+# floats and raises ZeroDivisionError like it expects.
+def _is_array(x):
+    return np is not None and isinstance(x, np.ndarray)
+
+def _clamp_positive(x):
+    if _is_array(x):
+        return np.maximum(x, 0)
+    return max(x, 0)
 
 class rbf(object):
+    # Kernels take squared distances, and work on both numbers and NumPy arrays.  Kernels
+    # other than linear also take the radius.
     @staticmethod
     def const(v):
-        return 1
+        return v*0 + 1
 
     @staticmethod
     def linear(r):
-        return math.sqrt(r)
+        return r ** 0.5
     #        pos = (v[0]-center[0], v[1]-center[1], v[2]-center[2])
     #        return math.sqrt(pos[0]*pos[0]+pos[1]*pos[1]+pos[2]*pos[2])
 
@@ -178,25 +624,219 @@ class rbf(object):
         return v*v
 
     @staticmethod
-    def gaussian(r):
-        return math.exp(-1.0*r)
+    def gaussian(r, radius=1):
+        if _is_array(r):
+            return np.exp(-1.0*r / (radius*radius))
+        return math.exp(-1.0*r / (radius*radius))
+
+    # Wendland's compactly supported kernels are zero beyond radius, so samples further apart
+    # than that don't affect each other and the kernel matrix is sparse.  These are positive
+    # definite in up to three dimensions, and are C0, C2 and C4 smooth.
+    @staticmethod
+    def wendland_c0(r, radius):
+        t = _clamp_positive(1 - r**0.5 / radius)
+        return t*t
+
+    @staticmethod
+    def wendland_c2(r, radius):
+        q = r**0.5 / radius
+        t = _clamp_positive(1 - q)
+        return (t*t)*(t*t) * (4*q + 1)
+
+    @staticmethod
+    def wendland_c4(r, radius):
+        q = r**0.5 / radius
+        t = _clamp_positive(1 - q)
+        return (t*t*t)*(t*t*t) * (35*q*q + 18*q + 3) / 3
+
+    # Kernels that are zero beyond radius.
+    compact_kernels = ('wendland_c0', 'wendland_c2', 'wendland_c4')
+
+    # Kernels whose kernel matrix is positive definite, so Cholesky can factor it directly.
+    positive_definite_kernels = ('gaussian',) + compact_kernels
+
+    # All kernels, in the order of the zRBF kernel attribute.
+    kernels = ('linear', 'gaussian') + compact_kernels
+
+    # Compact kernel matrices for at least this many samples are built and factored as sparse
+    # matrices, if SciPy is available.  Smaller ones are faster to solve densely.
+    sparse_min_samples = 256
+
+    # Compact kernels with at least this many samples are evaluated with a kd-tree over the
+    # samples, only visiting samples within radius of each input.
+    index_min_samples = 256
+
+    # Searching the kd-tree has some overhead for each call, so it's only used when the inputs
+    # times the samples is at least this much.  Below this, evaluating every sample is faster.
+    index_min_pairs = 10000
 
     @property
     def solvable(self):
         return self.result is not None
 
-    def __init__(self, values, points):
+    def __init__(self, values, points, backend=None, cache=None, previous=None, kernel='linear', radius=1.0):
+        """
+        Solve for the weights interpolating values at points.
+
+        kernel is one of the names in kernels.  radius is the size of the kernel: compact
+        kernels are zero beyond it, and it's the width of the Gaussian kernel.  It doesn't
+        affect the linear kernel.  With a compact kernel and SciPy, the kernel matrix is
+        sparse, so thousands of samples can be solved.
+
+        values is a value for each point, or a sequence of values for each point to
+        interpolate several channels at once.  All channels share the same kernel matrix,
+        so it's only factored once.  With multiple channels, eval returns a value for each
+        channel.
+
+        backend is 'numpy' or 'python'.  By default, NumPy is used if it's available.  The
+        Python backend is much slower, and is only meant for when NumPy isn't available.
+
+        If cache is a FactorizationCache, the kernel matrix factorization is looked up in it,
+        so creating an RBF with the same points and kernel as before only needs to solve for
+        the new values.
+
+        If previous is an earlier rbf and points only has one sample added, removed or moved
+        compared to it, its factorization is updated instead of factoring from scratch.  This
+        is O(n^2) instead of O(n^3).
+        """
+        if backend is None:
+            backend = 'numpy' if np is not None else 'python'
+        if backend not in ('numpy', 'python'):
+            raise ValueError('Unknown RBF backend: %s' % backend)
+        if backend == 'numpy' and np is None:
+            raise ValueError('The numpy RBF backend requires NumPy')
+        if kernel not in self.kernels:
+            raise ValueError('Unknown RBF kernel: %s' % kernel)
+        if not radius > 0:
+            raise ValueError('The RBF radius must be greater than zero')
+
+        self.backend = backend
         self.points = points
-        #self.func = self.gaussian
-        self.func = self.linear
+        self.kernel = kernel
+        self.radius = float(radius)
+        self.func = self._get_kernel_func()
         self.result = None
+        self._tree = None
 
         assert len(values) == len(points)
 
+        # channels is the number of values per point, or None if each point has one value.
+        self.channels = None
+        if len(values) and hasattr(values[0], '__len__'):
+            self.channels = len(values[0])
+
+        # The factorization is kept even if solving for these values fails, so it can be
+        # updated by the next RBF.
+        self.factorization = None
+        if backend == 'numpy':
+            dimensions = len(points[0]) if len(points) else 0
+            self.point_array = np.asarray(points, dtype=np.float64).reshape(len(points), dimensions)
+
         # Solving will always fail if we have less than two values.
         if len(points) <= 1:
             return
 
+        def factor():
+            if previous is not None:
+                factorization = self._update_factorization(previous)
+                if factorization is not None:
+                    return factorization
+            return self._factor()
+
+        try:
+            # If the samples haven't moved since previous, its factorization can be used as is,
+            # even if it's no longer in the cache.
+            reused = self._get_previous_factorization(previous)
+            if reused is not None:
+                self.factorization = cache.put(self.get_factorization_key(), reused) if cache is not None else reused
+            elif cache is not None:
+                self.factorization = cache.get(self.get_factorization_key(), factor)
+            else:
+                self.factorization = factor()
+            self.result = self._solve(self.factorization, values)
+        except SolveFailedError:
+            self.result = None
+
+    def _get_kernel_func(self):
+        func = getattr(self, self.kernel)
+        if self.kernel == 'linear':
+            return func
+
+        radius = self.radius
+        return lambda r: func(r, radius)
+
+    def get_kernel_key(self):
+        """
+        Return a key identifying the kernel.
+        """
+        radius = self.radius if self.kernel != 'linear' else None
+        return self.backend, self.kernel, radius
+
+    def get_factorization_key(self):
+        """
+        Return a key identifying the kernel matrix, which depends on the sample positions
+        and the kernel.
+        """
+        points = tuple(tuple(float(c) for c in point) for point in self.points)
+        return self.get_kernel_key() + (points,)
+
+    def _get_previous_factorization(self, previous):
+        """
+        Return previous's factorization if its samples and kernel are the same as ours,
+        otherwise None.
+        """
+        if previous is None or self.backend != 'numpy' or previous.factorization is None:
+            return None
+        if previous.get_kernel_key() != self.get_kernel_key():
+            return None
+        if not np.array_equal(previous.point_array, self.point_array):
+            return None
+        return previous.factorization
+
+    def _update_factorization(self, previous):
+        """
+        Return previous's factorization updated for our points, or None if it can't be.
+        """
+        if self.backend != 'numpy' or previous.factorization is None:
+            return None
+        if previous.get_kernel_key() != self.get_kernel_key():
+            return None
+
+        change = find_sample_change(previous.point_array, self.point_array)
+        if change is None:
+            return None
+
+        change_type, index = change
+        factorization = previous.factorization
+        try:
+            if change_type in ('remove', 'move'):
+                factorization = factorization.remove(index)
+            if change_type in ('add', 'move'):
+                column = self.func(squared_distances(self.point_array[index:index+1], self.point_array))[0]
+                factorization = factorization.insert(index, column)
+        except SolveFailedError:
+            return None
+
+        return factorization
+
+    @property
+    def sparse(self):
+        """
+        True if the kernel matrix is built and factored as a sparse matrix.
+        """
+        return (self.backend == 'numpy' and scipy_sparse is not None and self.kernel in self.compact_kernels and
+                len(self.points) >= self.sparse_min_samples)
+
+    def _factor(self):
+        if self.sparse:
+            return SparseFactorization(self._get_sparse_kernel_matrix())
+
+        if self.backend == 'numpy':
+            # The kernel matrix is symmetric, so it can be factored directly.
+            X = self.func(squared_distances(self.point_array, self.point_array))
+            return SymmetricFactorization(X)
+
+        points = self.points
         X = []
         for i in range(len(points)):
             item = []
@@ -207,43 +847,149 @@ class rbf(object):
                     total_squared += delta*delta
                 item.append(self.func(total_squared))
             X.append(item)
-#            print 'append', item
 
-        # print 'X:'
-        # print_matrix(X)
+        return PythonFactorization(X, normal_equations=self.kernel not in self.positive_definite_kernels)
 
-        Xt = transpose(X)
-        # print 'Xt:'
-        # print_matrix(Xt)
+    def _get_sparse_kernel_matrix(self):
+        """
+        Return the kernel matrix of a compact kernel as a SciPy sparse matrix.
 
-        XtX = mult(Xt, X)
-        # print 'XtX'
-        # print_matrix(XtX)
+        Only pairs of samples within radius of each other have nonzero entries, and these
+        are found with a kd-tree, so the dense matrix is never created.
+        """
+        offsets, indices, distances = self._get_tree().query_radius(self.point_array, self.radius, return_distances=True)
+        count = len(self.point_array)
+        return scipy_sparse.csr_matrix((self.func(distances), indices, offsets), shape=(count, count))
 
-        Xty = dot(Xt, values)
-        # print 'Xty', Xty
+    @property
+    def indexed(self):
+        """
+        True if the RBF is evaluated with a spatial index over the samples.
+        """
+        return (self.backend == 'numpy' and self.kernel in self.compact_kernels and
+                len(self.points) >= self.index_min_samples)
 
-        try:
-            self.result = solve(XtX, Xty)
-            # print 's:', self.result
-        except SolveFailedError:
-            self.result = None
+    def _use_index(self, count):
+        return self.indexed and count * len(self.points) >= self.index_min_pairs
+
+    def _get_tree(self):
+        """
+        Return a kd-tree over the sample positions.  This is created the first time it's
+        needed, and shared by building the sparse kernel matrix and evaluating.
+        """
+        if self._tree is None:
+            from zMayaTools import array_kdtree
+            self._tree = array_kdtree.KDTree(self.point_array)
+        return self._tree
+
+    def _solve(self, factorization, values):
+        if self.backend == 'numpy':
+            return factorization.solve(np.asarray(values, dtype=np.float64))
+
+        if self.channels is None:
+            return factorization.solve(values)
+
+        # Solve each channel against the same factorization, and store the weights with
+        # a row for each point, like the NumPy backend.
+        return transpose([factorization.solve(column) for column in transpose(values)])
+
+    def _zero(self):
+        if self.channels is None:
+            return 0
+        if self.backend == 'numpy':
+            return np.zeros(self.channels)
+        return [0] * self.channels
 
     def eval(self, t):
+        """
+        Evaluate the RBF at t.
+
+        If the RBF has multiple channels, return a value for each channel, as an array with
+        the NumPy backend or a list with the Python backend.
+        """
         if self.result is None:
-            return 0
+            return self._zero()
+
+        if self._use_index(1):
+            result = self._eval_indexed(np.asarray(t, dtype=np.float64).reshape(1, -1))[0]
+            return float(result) if self.channels is None else result
+
+        if self.backend == 'numpy':
+            delta = self.point_array - np.asarray(t, dtype=np.float64)
+            result = np.dot(self.func(np.einsum('ij,ij->i', delta, delta)), self.result)
+            return float(result) if self.channels is None else result
 
-        out = 0
+        out = self._zero()
         for i in range(len(self.result)):
             total_squared = 0
             for channel in range(len(self.points[i])):
                 delta = t[channel] - self.points[i][channel]
                 total_squared += delta*delta
 
-            out += self.result[i] * self.func(total_squared)
+            weight = self.func(total_squared)
+            if self.channels is None:
+                out += self.result[i] * weight
+            else:
+                for channel in range(self.channels):
+                    out[channel] += self.result[i][channel] * weight
 
         return out
 
+    # The most inputs to evaluate at once in eval_many, to limit the size of the distance
+    # matrix.
+    eval_chunk_size = 4096
+
+    def eval_many(self, inputs):
+        """
+        Evaluate the RBF at each of an (M,D) batch of inputs.
+
+        With the NumPy backend, return an (M,) array, or (M,C) with C channels.  This computes
+        the distances between all inputs and samples at once, and applies the weights for
+        every channel with one matrix product, which is much faster than calling eval() for
+        each input.  With the Python backend, return a list.
+
+        With a compact kernel and many samples, only samples within radius of each input are
+        evaluated, so the cost depends on how many samples are near the inputs rather than
+        the total number of samples.  This is also done by eval() with very many samples.
+        """
+        if self.backend != 'numpy':
+            return [self.eval(t) for t in inputs]
+
+        shape = (len(inputs),) if self.channels is None else (len(inputs), self.channels)
+        if self.result is None or not len(inputs):
+            return np.zeros(shape)
+
+        inputs = np.asarray(inputs, dtype=np.float64).reshape(len(inputs), -1)
+
+        results = np.empty(shape)
+        for start in range(0, len(inputs), self.eval_chunk_size):
+            end = start + self.eval_chunk_size
+            if self._use_index(end - start):
+                results[start:end] = self._eval_indexed(inputs[start:end])
+            else:
+                kernel = self.func(squared_distances(inputs[start:end], self.point_array))
+                results[start:end] = np.dot(kernel, self.result)
+        return results
+
+    def _eval_indexed(self, inputs):
+        """
+        Evaluate a compact kernel RBF at an (M,D) array of inputs, using only the samples
+        within radius of each input.
+        """
+        # Find the samples near each input, and sum their contributions to each input.
+        offsets, indices, distances = self._get_tree().query_radius(inputs, self.radius, return_distances=True)
+        rows = np.repeat(np.arange(len(inputs)), np.diff(offsets))
+        weights = self.func(distances)
+
+        if self.channels is None:
+            return np.bincount(rows, weights=weights * self.result[indices], minlength=len(inputs))
+
+        contributions = weights[:,np.newaxis] * self.result[indices]
+        results = np.empty((len(inputs), self.channels))
+        for channel in range(self.channels):
+            results[:,channel] = np.bincount(rows, weights=contributions[:,channel], minlength=len(inputs))
+        return results
+
 def xgo():
     points = [(0, 0, 0),]
 #    points = [(0, 0, 0), (1, 0, 0), (2, 0, 0)]
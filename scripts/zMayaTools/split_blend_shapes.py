@@ -1,4 +1,4 @@
-import math, re
+import re
 import pymel.core as pm
 import maya.cmds as cmds
 import maya.OpenMaya as OpenMaya
@@ -10,57 +10,48 @@ log = maya_logging.get_log()
 
 def scale(x, l1, h1, l2, h2):
     return (x - l1) * (h2 - l2) / (h1 - l1) + l2
-def _to_vtx_list(p):
-    return [(x, y, z) for x, y, z in zip(p[0::3], p[1::3], p[2::3])]
 
 def split_blend_shape(base_mesh, target_mesh, right_side=True, fade_distance=2, axis=0, axis_origin=0):
+    # This requires NumPy.  It's imported here, so the rest of the module can be loaded
+    # without it.
+    import numpy as np
+    from zMayaTools import mesh_arrays
+
     # Read the positions in world space.  Although the shapes should be in the same position,
     # we want world space units so the distance factor makes sense.
     #
-    # We do this with cmds instead of pm, since it's faster for dealing with lots of vertex
-    # data.
-    target_pos = _to_vtx_list(cmds.xform('%s.vtx[*]' % target_mesh, q=True, t=True, ws=True))
-    base_pos = _to_vtx_list(cmds.xform('%s.vtx[*]' % base_mesh, q=True, t=True, ws=True))
+    # We read these directly into arrays and work on all vertices at once, since it's much
+    # faster for dealing with lots of vertex data.
+    target_pos = mesh_arrays.get_world_points(target_mesh)
+    base_pos = mesh_arrays.get_world_points(base_mesh)
     if len(target_pos) != len(base_pos):
-        OpenMaya.MGlobal.displayError('Target has %i vertices, but base has %i vertices.' % (len(target_pos) != len(base_pos)))
+        OpenMaya.MGlobal.displayError('Target has %i vertices, but base has %i vertices.' % (len(target_pos), len(base_pos)))
         return
 
-    result_pos = []
-    new_target_pos = []
-    for idx in range(len(target_pos)):
-        dist = target_pos[idx][axis]
-        dist -= axis_origin
+    dist = target_pos[:,axis] - axis_origin
 
-        if fade_distance == 0:
-            p = 0 if dist < 0 else 1
-        else:
-            p = scale(dist, -fade_distance/2.0, fade_distance/2.0, 0, 1.0)
-
-        # If we're fading in the left side instead of the right, flip the value.
-        if not right_side:
-            p = 1-p
-
-        p = min(max(p, 0), 1)
-
-        # Clean up the percentage.  It's easy to end up with lots of values like 0.000001, and clamping
-        # them to zero or one can give a smaller file.
-        if p < 0.001: p = 0
-        if p > .999: p = 1
-        delta = [target_pos[idx][i] - base_pos[idx][i] for i in range(3)]
-        new_target_pos.append([base_pos[idx][i] + delta[i]*p for i in range(3)])
-
-    def distance_squared(a, b):
-        p0 = math.pow(a[0]-b[0], 2)
-        p1 = math.pow(a[1]-b[1], 2)
-        p2 = math.pow(a[2]-b[2], 2)
-        return math.pow(p0 + p1 + p2, 1)
-
-    for idx in range(len(new_target_pos)):
-        old = target_pos[idx]
-        new = new_target_pos[idx]
-        if distance_squared(old, new) < 0.0001:
-            continue
-        cmds.xform('%s.vtx[%i]' % (target_mesh, idx), t=new_target_pos[idx], ws=True)
+    if fade_distance == 0:
+        p = np.where(dist < 0, 0.0, 1.0)
+    else:
+        p = scale(dist, -fade_distance/2.0, fade_distance/2.0, 0, 1.0)
+
+    # If we're fading in the left side instead of the right, flip the value.
+    if not right_side:
+        p = 1-p
+
+    p = np.clip(p, 0, 1)
+
+    # Clean up the percentage.  It's easy to end up with lots of values like 0.000001, and clamping
+    # them to zero or one can give a smaller file.
+    p[p < 0.001] = 0
+    p[p > .999] = 1
+    new_target_pos = base_pos + (target_pos - base_pos) * p[:,np.newaxis]
+
+    # Only move vertices that changed.
+    delta = new_target_pos - target_pos
+    changed = np.flatnonzero(np.einsum('ij,ij->i', delta, delta) >= 0.0001)
+    for idx in changed.tolist():
+        cmds.xform('%s.vtx[%i]' % (target_mesh, idx), t=new_target_pos[idx].tolist(), ws=True)
 
 def get_connected_input_geometry(blend_shape):
 	"""
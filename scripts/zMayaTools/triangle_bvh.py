@@ -0,0 +1,286 @@
+# A flat, array-backed bounding volume hierarchy over triangles, for finding the closest
+# point on a mesh surface.
+#
+# This is laid out like array_kdtree.KDTree, but partitions triangles instead of points:
+#
+# - triangles: the (T,3) vertex indices of each triangle, reordered so every node's
+#   triangles are a contiguous range
+# - indices: the permutation from triangles back to the caller's triangle indices
+# - node_start/node_end: the range of triangles covered by each node
+# - node_left/node_right: child node indices, or -1 for leaves
+# - node_lo/node_hi: each node's bounding box, which covers its triangles completely
+#
+# Triangles are split by their centroids, so sibling boxes can overlap.
+#
+# Distances are squared, like array_kdtree.
+import numpy as np
+
+def closest_points_on_triangles(points, a, b, c):
+    """
+    Find the closest point to each point in an (M,3) array on the corresponding triangle
+    given by (M,3) arrays of corners.
+
+    Return the (M,3) barycentric coordinates of each closest point, weighting a, b and c.
+
+    This is the region test from Ericson's Real-Time Collision Detection, done for all
+    points at once.
+    """
+    def dot(x, y):
+        return np.einsum('ij,ij->i', x, y)
+
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = dot(ab, ap)
+    d2 = dot(ac, ap)
+    d3 = dot(ab, bp)
+    d4 = dot(ac, bp)
+    d5 = dot(ab, cp)
+    d6 = dot(ac, cp)
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Start with points projecting inside the triangle, then overwrite them with each
+        # region in reverse order of priority, so the first matching region wins.
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        result = np.stack([1 - v - w, v, w], axis=1)
+
+        # Edge BC
+        bc_t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        result[region] = np.stack([np.zeros(region.sum()), 1 - bc_t[region], bc_t[region]], axis=1)
+
+        # Edge AC
+        ac_t = d2 / (d2 - d6)
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        result[region] = np.stack([1 - ac_t[region], np.zeros(region.sum()), ac_t[region]], axis=1)
+
+        # Edge AB
+        ab_t = d1 / (d1 - d3)
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        result[region] = np.stack([1 - ab_t[region], ab_t[region], np.zeros(region.sum())], axis=1)
+
+    # Vertex regions
+    result[(d6 >= 0) & (d5 <= d6)] = (0, 0, 1)
+    result[(d3 >= 0) & (d4 <= d3)] = (0, 1, 0)
+    result[(d1 <= 0) & (d2 <= 0)] = (1, 0, 0)
+
+    # Degenerate triangles can divide by zero.  Use the closest corner for those.
+    bad = ~np.isfinite(result).all(axis=1)
+    if bad.any():
+        corner_dist = np.stack([dot(ap[bad], ap[bad]), dot(bp[bad], bp[bad]), dot(cp[bad], cp[bad])], axis=1)
+        result[bad] = np.identity(3)[np.argmin(corner_dist, axis=1)]
+
+    return result
+
+class TriangleBVH(object):
+    # The number of queries to search at once in query().
+    query_chunk_size = 16384
+
+    def __init__(self, vertices, triangles, leaf_size=8):
+        """
+        Build a BVH from an (N,3) array of vertex positions and a (T,3) array of vertex
+        indices for each triangle.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        triangles = np.asarray(triangles, dtype=np.intp)
+        if vertices.ndim != 2 or vertices.shape[1] != 3:
+            raise ValueError('vertices must be an (N,3) array')
+        if triangles.ndim != 2 or triangles.shape[1] != 3:
+            raise ValueError('triangles must be a (T,3) array')
+        if leaf_size < 1:
+            raise ValueError('leaf_size must be at least 1')
+
+        self.vertices = vertices
+        self.leaf_size = leaf_size
+        self._build(triangles)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _build(self, triangles):
+        count = len(triangles)
+        perm = np.arange(count)
+        corners = self.vertices[triangles]
+        tri_lo = corners.min(axis=1)
+        tri_hi = corners.max(axis=1)
+        centroids = corners.mean(axis=1)
+
+        node_start = []
+        node_end = []
+        node_left = []
+        node_right = []
+        node_lo = []
+        node_hi = []
+
+        def add_node(start, end):
+            node_start.append(start)
+            node_end.append(end)
+            node_left.append(-1)
+            node_right.append(-1)
+            node_lo.append(None)
+            node_hi.append(None)
+            return len(node_start) - 1
+
+        stack = [add_node(0, count)] if count else []
+        while stack:
+            node = stack.pop()
+            start, end = node_start[node], node_end[node]
+
+            node_tris = perm[start:end]
+            node_lo[node] = tri_lo[node_tris].min(axis=0)
+            node_hi[node] = tri_hi[node_tris].max(axis=0)
+
+            if end - start <= self.leaf_size:
+                continue
+
+            # Split on the axis where the centroids are most spread out.  If they're all in
+            # the same place there's nothing to split, so leave it as a large leaf.
+            node_centroids = centroids[node_tris]
+            extent = node_centroids.max(axis=0) - node_centroids.min(axis=0)
+            axis = int(np.argmax(extent))
+            if extent[axis] == 0:
+                continue
+
+            mid = (start + end) // 2
+            order = np.argpartition(node_centroids[:,axis], mid - start)
+            perm[start:end] = node_tris[order]
+
+            node_left[node] = add_node(start, mid)
+            node_right[node] = add_node(mid, end)
+
+            stack.append(node_right[node])
+            stack.append(node_left[node])
+
+        self.indices = perm
+        self.triangles = np.ascontiguousarray(triangles[perm])
+        self.node_start = np.array(node_start, dtype=np.intp)
+        self.node_end = np.array(node_end, dtype=np.intp)
+        self.node_left = np.array(node_left, dtype=np.intp)
+        self.node_right = np.array(node_right, dtype=np.intp)
+        self.node_lo = np.array(node_lo, dtype=np.float64).reshape(-1, 3)
+        self.node_hi = np.array(node_hi, dtype=np.float64).reshape(-1, 3)
+
+    def query(self, points, max_distance=None):
+        """
+        Find the closest point on the surface to each point in an (M,3) array of points.
+
+        Return (triangle_indices, barycentrics, distances).  triangle_indices are indices into
+        the triangle array the BVH was created with, barycentrics is an (M,3) array weighting
+        that triangle's vertices, and distances are squared.
+
+        If max_distance is given, only surface points within that squared distance are
+        returned.  Points without a match get a triangle index of -1, barycentrics of 0
+        and a distance of inf.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError('Expected an (N,3) array of points')
+
+        # As in array_kdtree, step the bound up so surfaces exactly at max_distance are included.
+        bound = np.inf if max_distance is None else np.nextafter(float(max_distance), np.inf)
+
+        best_tri = np.full(len(points), -1, dtype=np.intp)
+        best_bary = np.zeros((len(points), 3))
+        best_dist = np.full(len(points), np.inf)
+        if not len(self.node_start):
+            return best_tri, best_bary, best_dist
+
+        for start in range(0, len(points), self.query_chunk_size):
+            end = start + self.query_chunk_size
+            pos, bary, dist = self._query(points[start:end], bound)
+            found = pos != -1
+            if max_distance is not None:
+                found &= dist <= max_distance
+            best_tri[start:end][found] = self.indices[pos[found]]
+            best_bary[start:end][found] = bary[found]
+            best_dist[start:end][found] = dist[found]
+
+        return best_tri, best_bary, best_dist
+
+    def _query(self, points, bound):
+        best_dist = np.full(len(points), bound)
+        best_pos = np.full(len(points), -1, dtype=np.intp)
+        best_bary = np.zeros((len(points), 3))
+
+        # Start by searching the leaf each point is closest to on a greedy descent, to find a
+        # close match quickly so most of the tree can be pruned below.
+        queries = np.arange(len(points))
+        first_leaf = self._find_leaves(points)
+        self._scan_leaves(points, queries, first_leaf, best_dist, best_pos, best_bary)
+
+        # Walk the tree a level at a time, as in array_kdtree.KDTree._query_knn.
+        pair_query = queries
+        pair_node = np.zeros(len(points), dtype=np.intp)
+        while len(pair_query):
+            box_dist = self._box_distances(points[pair_query], pair_node)
+            keep = box_dist < best_dist[pair_query]
+            pair_query = pair_query[keep]
+            pair_node = pair_node[keep]
+
+            is_leaf = self.node_left[pair_node] == -1
+            leaf_query = pair_query[is_leaf]
+            leaf_node = pair_node[is_leaf]
+            unsearched = leaf_node != first_leaf[leaf_query]
+            self._scan_leaves(points, leaf_query[unsearched], leaf_node[unsearched], best_dist, best_pos, best_bary)
+
+            parent_query = pair_query[~is_leaf]
+            parent_node = pair_node[~is_leaf]
+            pair_query = np.concatenate([parent_query, parent_query])
+            pair_node = np.concatenate([self.node_left[parent_node], self.node_right[parent_node]])
+
+        return best_pos, best_bary, best_dist
+
+    def _find_leaves(self, points):
+        """
+        Descend from the root to a leaf for each point, going into whichever child's
+        bounding box is closer.
+        """
+        node = np.zeros(len(points), dtype=np.intp)
+        while True:
+            internal = np.flatnonzero(self.node_left[node] != -1)
+            if not len(internal):
+                return node
+
+            parent = node[internal]
+            left = self.node_left[parent]
+            right = self.node_right[parent]
+            left_dist = self._box_distances(points[internal], left)
+            right_dist = self._box_distances(points[internal], right)
+            node[internal] = np.where(right_dist < left_dist, right, left)
+
+    def _box_distances(self, points, nodes):
+        delta = np.maximum(self.node_lo[nodes] - points, 0)
+        delta += np.maximum(points - self.node_hi[nodes], 0)
+        return np.einsum('ij,ij->i', delta, delta)
+
+    def _scan_leaves(self, points, queries, leaves, best_dist, best_pos, best_bary):
+        """
+        Find the closest point on each triangle in each query's leaf, and keep the closest.
+        """
+        if not len(queries):
+            return
+
+        starts = self.node_start[leaves]
+        counts = self.node_end[leaves] - starts
+        group_starts = np.cumsum(counts) - counts
+        cand_query = np.repeat(queries, counts)
+        cand_pos = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(group_starts, counts)
+
+        corners = self.vertices[self.triangles[cand_pos]]
+        query_points = points[cand_query]
+        cand_bary = closest_points_on_triangles(query_points, corners[:,0], corners[:,1], corners[:,2])
+        closest = np.einsum('ij,ijk->ik', cand_bary, corners)
+        delta = closest - query_points
+        cand_dist = np.einsum('ij,ij->i', delta, delta)
+
+        np.minimum.at(best_dist, cand_query, cand_dist)
+        won = np.flatnonzero(cand_dist == best_dist[cand_query])
+        best_pos[cand_query[won]] = cand_pos[won]
+        best_bary[cand_query[won]] = cand_bary[won]
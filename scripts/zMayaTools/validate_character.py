@@ -174,59 +174,28 @@ class Validate(object):
     def check_overlapping_vertices(self):
         """
         Verify that meshes have no overlapping vertices.
-
-        Note that this will fail if the overlap threshold is so high that all vertices are
-        merged, since polyMergeVert will fail with a "Can't perform polyMergeVert on selection"
-        error.
         """
+        # The mesh checks need NumPy.  It's imported here so the other checks still work
+        # without it.
+        import numpy as np
+        from zMayaTools import array_kdtree
+
         shape = self.node.getShape()
+        vertices = get_vertices(shape)
+        if not vertices:
+            return
 
-        # Delete any nodes created while doing this when we're done.
-        with maya_helpers.temporary_namespace():
-            # Create a polyMergeVert to remove overlapping vertices, outputting to a temporary mesh.
-            merge_vert = pm.createNode('polyMergeVert', name='TempMergeVert')
-            merge_vert.inputComponents.set((1, 'vtx[*]'), type='componentList')
-            merge_vert.distance.set(self.config['vertex_overlap_threshold'])
-            temp_mesh = pm.createNode('mesh', name='TempMesh')
-            shape.outMesh.connect(merge_vert.inputPolymesh, force=True)
-
-            # Why does mesh.inMesh print a "Defaulting to MFnDagNode" warning?
-            # merge_vert.attr('output') #.connect(temp_mesh.inMesh)
-            cmds.connectAttr(str(merge_vert.output), '%s.inMesh' % temp_mesh.name())
-
-            # polyMergeVert always removes vertices without reordering them, so we can figure out which
-            # vertices were actually removed by walking through both vertex lists in order.  This won't
-            # tell us which vertex it matched against, but it'll give enough information for us to highlight
-            # the problem.
-            output_vtx_idx = 0
-            missing_vertices = []
-            input_vertices = get_vertices(shape)
-            output_vertices = get_vertices(temp_mesh)
-#            print len(input_vertices), len(output_vertices)
-
-            # this isn't quite right:
-            # when vertices are merged they move to the average position, which means we won't find
-            # a match for either input vertex
-            # this causes us to never sync back up and flag all vertices after that
-            for input_vtx_idx, input_vtx in enumerate(input_vertices):
-                # If we've run out of output vertices, all remaining input vertices are missing.
-                if output_vtx_idx >= len(output_vertices):
-                    missing_vertices.append(shape.vtx[input_vtx_idx])
-                    continue
-
-                output_vtx = output_vertices[output_vtx_idx]
-                distance = get_distance(input_vtx, output_vtx)
-                if distance > 0.00001:
-                    # This input vertex is missing.
-                    missing_vertices.append(shape.vtx[input_vtx_idx])
-                    continue
-
-                output_vtx_idx += 1
-
-            if missing_vertices:
-                self.log('Mesh has %i overlapping %s.' %
-                        (len(missing_vertices), 'vertex' if len(missing_vertices) == 1 else 'vertices'),
-                        nodes=missing_vertices)
+        # Find all vertices within the threshold of each vertex.  Every vertex will find
+        # itself, so any vertex with more than one match overlaps another vertex.
+        tree = array_kdtree.KDTree(vertices)
+        offsets, _ = tree.query_radius(vertices, self.config['vertex_overlap_threshold'])
+        overlapping = np.flatnonzero(np.diff(offsets) > 1)
+
+        if len(overlapping):
+            overlapping_vertices = ['%s.vtx[%i]' % (shape.name(), idx) for idx in overlapping]
+            self.log('Mesh has %i overlapping %s.' %
+                    (len(overlapping_vertices), 'vertex' if len(overlapping_vertices) == 1 else 'vertices'),
+                    nodes=overlapping_vertices)
 
     def check_vertex_tweaks(self, base=True):
         """
@@ -352,101 +321,53 @@ class Validate(object):
                 self.log('All shape nodes except the first should be intermediate', nodes=[shape])
 
     def check_topological_symmetry(self, shape, vertices):
+        import numpy as np
+        from zMayaTools import mesh_arrays, mesh_topology
+
         # We expect the mesh to be symmetric across the YZ plane.  Find vertices along it.
-        vertices_on_symmetry_plane = []
-        for idx, vert in enumerate(vertices):
-            if abs(vert[0]) < 0.001:
-                vertices_on_symmetry_plane.append(idx)
+        vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+        on_symmetry_plane = np.abs(vertices[:,0]) < 0.001
 
-        if not vertices_on_symmetry_plane:
+        if not on_symmetry_plane.any():
             self.log('Mesh isn\'t topologically symmetric (no vertices found on the YZ plane)', nodes=[self.node])
             return
 
-        # We need a list of vertices to pass to polyListComponentConversion.  shape.vtx[idx] gives us it,
-        # but that's very slow.  It's much faster to just give a list of component path strings.
-        verts = ['%s.vtx[%i]' % (shape.name(), idx) for idx in vertices_on_symmetry_plane]
-
         # Find edges connecting vertices on the YZ plane.  These should all be valid edges for topological
         # symmetry.
-        symmetry_edges = pm.polyListComponentConversion(verts, toEdge=True, internal=True)
+        face_counts, face_connects = mesh_arrays.MayaMesh(shape).get_face_vertices()
+        half_edges = mesh_topology.HalfEdges(face_counts, face_connects, len(vertices))
+        edge_start = half_edges.vertex
+        edge_end = half_edges.vertex[half_edges.next]
+        symmetry_edges = np.flatnonzero(on_symmetry_plane[edge_start] & on_symmetry_plane[edge_end] & (half_edges.opposite != -1))
 
-        if not symmetry_edges:
+        if not len(symmetry_edges):
             self.log('Mesh isn\'t topologically symmetric (no edges found on the YZ plane)', nodes=[self.node])
             return
-        # symmetry_edges is a list of component sets.  Use the first entry in the first set.
-        symmetry_edge = pm.ls(symmetry_edges[0])[0].currentItem()
 
-        # Try to activate symmetry.  This will fail if the mesh isn't topologically symmetric around the
-        # selected edge.  Unfortunately, this will also print an error and raise an exception instead of
-        # just returning whether it succeeded.  There doesn't seem to be any direct API for topo symmetry.
+        # Use the first edge we found, and see if the mesh is symmetric around it.
+        symmetry_edge = (int(edge_start[symmetry_edges[0]]), int(edge_end[symmetry_edges[0]]))
         try:
-            pm.symmetricModelling(symmetry_edge, topoSymmetry=True)
-        except RuntimeError as e:
-            self.log('Mesh isn\'t topologically symmetric (selected %s as symmetry edge)' % symmetry_edge, nodes=[self.node])
+            mesh_topology.make_topological_symmetry_map(face_counts, face_connects, seam_edge=symmetry_edge,
+                vertex_count=len(vertices))
+        except ValueError as e:
+            self.log('Mesh isn\'t topologically symmetric (selected vertices %i and %i as symmetry edge): %s' % (symmetry_edge + (e,)), nodes=[self.node])
             return
 
-        # Disable topological symmetry.  We only activated it to see if it succeeds.
-        pm.symmetricModelling(topoSymmetry=False)
-
-    def check_world_space_symmetry(self, shape, vertices, tolerance=0.001):
+    def check_world_space_symmetry(self, shape, tolerance=0.001):
         """
         Check if a mesh is symmetric around YZ.
         """
-        # Find all vertices that are on -X, or on the YZ plane.
-        indices = []
-        for idx, vert in enumerate(vertices):
-            if vert[0] < 0.0001:
-                indices.append(idx)
-
-        # Select those vertices with symmetry, so we also select symmetric vertices.
-        verts = ['%s.vtx[%i]' % (shape.name(), idx) for idx in indices]
-
-        old_symmetry = pm.symmetricModelling(q=True, symmetry=True)
-        old_about = pm.symmetricModelling(q=True, about=True)
-        old_axis = pm.symmetricModelling(q=True, axis=True)
-        old_tolerance = pm.symmetricModelling(q=True, tolerance=True)
-        
-        def get_selected_vertices():
-            result = []
-            sel = om.MSelectionList()
-            om.MGlobal.getActiveSelectionList(sel)
-
-            selection_iter = om.MItSelectionList(sel)
-            while not selection_iter.isDone():
-                plug = om.MDagPath()
-                component = om.MObject()
-                selection_iter.getDagPath(plug, component)
-                
-                vertex_iter = om.MItGeometry(plug, component)
-                while not vertex_iter.isDone():
-                    result.append(vertex_iter.index())
-                    vertex_iter.next()
-                
-                selection_iter.next()
-            return result
+        from zMayaTools import vertex_mapping
 
-        try:
-            pm.symmetricModelling(e=True, symmetry=True, about='world', axis='x', tolerance=tolerance)
-            pm.select(verts, symmetry=True)
-
-            # Find the indices of any vertices that weren't selected.  This is a bit roundabout
-            # since pm.runtime.InvertSelection doesn't work.
-            all_indices = set(range(len(vertices)))
-
-            selected_indices = set(get_selected_vertices())
-            deselected_indices = all_indices - selected_indices
-
-            if deselected_indices:
-                deselected_verts = ' '.join('%s.vtx[%i]' % (shape.name(), idx) for idx in deselected_indices)
-                self.log('Mesh isn\'t world space symmetric (%i unmatched %s)' % (len(deselected_indices), 'vertex' if len(deselected_indices) == 1 else'vertices'),
-                        nodes=deselected_verts)
-        finally:
-            pm.select(deselect=True)
-            try:
-                pm.symmetricModelling(e=True, symmetry=old_symmetry, about=old_about, axis=old_axis, tolerance=old_tolerance)
-            except RuntimeError:
-                # Ignore errors if the previous symmetry mode doesn't activate for some reason.
-                pass
+        # Search for the mirror of every vertex on +X.  Vertices on -X or on the YZ plane are
+        # the sources, so vertices on +X without a match are asymmetric.
+        vertex_array, unmapped = vertex_mapping.make_vertex_symmetry_array(shape, threshold=tolerance*tolerance,
+            positive_to_negative=False)
+
+        if len(unmapped):
+            deselected_verts = ' '.join('%s.vtx[%i]' % (shape.name(), idx) for idx in unmapped)
+            self.log('Mesh isn\'t world space symmetric (%i unmatched %s)' % (len(unmapped), 'vertex' if len(unmapped) == 1 else'vertices'),
+                    nodes=deselected_verts)
         
     def check_joint_label_symmetry(self, joints):
         """
@@ -904,7 +825,7 @@ class Validate(object):
         self.check_topological_symmetry(output, output_points)
 
         self.progress.set_task_progress('Checking world space symmetry', percent=0.6, force=True)
-        self.check_world_space_symmetry(output, output_points, self.config['vertex_error_threshold'])
+        self.check_world_space_symmetry(output, self.config['vertex_error_threshold'])
 
         if not self.warnings:
             self.log('%s: OK' % self.node.nodeName(), nodes=[self.node])
@@ -1,100 +1,511 @@
-from pymel import core as pm
-from maya import cmds
-from zMayaTools import kdtree
+# Shapes can be given as a mesh in the scene, or as a mesh adapter from mesh_arrays, such
+# as a mesh_arrays.ArrayMesh to map vertices without Maya.
+import collections, errno, hashlib, os
+import numpy as np
+from zMayaTools import mesh_arrays, mesh_topology, point_matching, triangle_bvh, util
 
-class PointWithIndex(object):
+def _get_vertices(shape):
     """
-    A helper for storing vertex indices along with vertices in kdtree.
+    Return the world space vertex positions of shape as an (N,3) array.
     """
+    return mesh_arrays.get_world_points(shape)
 
-    def __init__(self, point, idx):
-        self.coords = point
-        self.idx = idx
+# Vertex maps come in two forms.  The dictionary form is {dst: src} plus a set of unmatched
+# destination vertices.  The array form is an int32 array with the source vertex of each
+# destination vertex, or -1 if it has none, plus an int32 array of unmatched destination
+# vertices.  The array form is much smaller for large meshes, and can be used to gather
+# per-vertex data directly, eg. values[vertex_array].
 
-    def __len__(self):
-        return len(self.coords)
+def vertex_map_to_array(index_mapping, count):
+    """
+    Convert a {dst: src} vertex map to an array of length count.
+    """
+    vertex_array = np.full(count, -1, dtype=np.int32)
+    dst = np.fromiter(index_mapping.keys(), dtype=np.int64, count=len(index_mapping))
+    src = np.fromiter(index_mapping.values(), dtype=np.int64, count=len(index_mapping))
+    vertex_array[dst] = src
+    return vertex_array
+
+def vertex_array_to_map(vertex_array):
+    """
+    Convert an array vertex map to a {dst: src} dictionary, leaving out unmatched vertices.
+    """
+    vertex_array = np.asarray(vertex_array)
+    dst = np.flatnonzero(vertex_array != -1)
+    return dict(zip(dst.tolist(), vertex_array[dst].tolist()))
+
+_axes = {'x': (1, 0, 0), 'y': (0, 1, 0), 'z': (0, 0, 1)}
+
+def get_symmetry_plane(axis_of_symmetry='x', axis_origin=0):
+    """
+    Return the plane of symmetry as a (normal, origin) tuple, where normal is a unit
+    vector tuple and the plane is every point p with dot(normal, p) == origin.
+
+    axis_of_symmetry is 'x', 'y' or 'z', or the plane's normal as a vector.  axis_origin is
+    the position of the plane along it, like split_blend_shapes' axis_origin.
+    """
+    try:
+        normal = _axes[axis_of_symmetry]
+    except (KeyError, TypeError):
+        normal = axis_of_symmetry
+
+    try:
+        normal = np.asarray(normal, dtype=np.float64)
+    except ValueError:
+        normal = None
+    if normal is None or normal.shape != (3,) or not np.linalg.norm(normal) > 0:
+        raise ValueError('Invalid axis of symmetry: %r' % (axis_of_symmetry,))
+
+    normal = normal / np.linalg.norm(normal)
+    return tuple(normal.tolist()), float(axis_origin)
+
+def _mirror_points(points, plane):
+    """
+    Return (mirrored points, signed distance of each point from the plane).
+    """
+    normal, origin = plane
+    normal = np.array(normal)
+    side = np.dot(points, normal) - origin
+    return points - 2 * side[:,np.newaxis] * normal, side
+
+# Increase this if the symmetry map cache key or spilled file format changes.
+_symmetry_map_cache_version = 3
+
+def get_symmetry_map_key(shape, threshold, plane, positive_to_negative):
+    """
+    Return the symmetry map cache key for a shape and make_vertex_symmetry_map arguments.
+    plane is from get_symmetry_plane.
 
-    def __getitem__(self, i):
-        return self.coords[i]
+    This is a hash of the vertex count, topology and vertex positions.  Positions are rounded
+    to a small fraction of the matching distance, so changes too small to affect matching
+    don't invalidate the map.
+    """
+    mesh = mesh_arrays.get_mesh(shape)
+    vertices = _get_vertices(mesh)
+    face_counts, face_connects = mesh.get_face_vertices()
+
+    quantum = SymmetryMapCache.quantize_fraction * np.sqrt(threshold)
+    if quantum > 0:
+        quantized = np.round(vertices / quantum).astype(np.int64)
+    else:
+        quantized = vertices
 
-    def __repr__(self):
-        return 'Item({}, {}, {})'.format(self.coords[0], self.coords[1], self.idx)
+    hasher = hashlib.sha1()
+    normal, origin = plane
+    hasher.update(('%i %i %r %r %r %r %r %i' % ((_symmetry_map_cache_version, len(vertices), float(threshold))
+        + normal + (origin, bool(positive_to_negative)))).encode('ascii'))
+    hasher.update(np.ascontiguousarray(face_counts, dtype=np.int32).tobytes())
+    hasher.update(np.ascontiguousarray(face_connects, dtype=np.int32).tobytes())
+    hasher.update(np.ascontiguousarray(quantized).tobytes())
+    return hasher.hexdigest()
 
-def make_vertex_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True):
+class SymmetryMapCache(object):
+    """
+    A cache of symmetry maps, so tools that repeatedly mirror the same mesh don't have to
+    match its vertices every time.
+
+    Maps are keyed by get_symmetry_map_key, so any change to the mesh's topology or points
+    gives a new map.  The key takes a hash of the whole mesh, so for meshes in the scene,
+    we also remember the key for each node until a dirty callback on the mesh or one of its
+    parents tells us it may have changed.  Looking up an unchanged mesh doesn't need to
+    read it at all.
+
+    The most recently used max_entries maps are kept in memory.  If spill_path is set, maps
+    evicted from memory are written there, and read back if they're needed again.
+    """
+    # The fraction of the matching distance that points are rounded to for the cache key.
+    quantize_fraction = 0.01
+
+    def __init__(self, max_entries=16, spill_path=None):
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+
+        # {key: _SymmetryMapEntry}, in least recently used order.
+        self._maps = collections.OrderedDict()
+
+        # For meshes in the scene, {handle hash: (MObjectHandle, callbacks, {args: key})}.
+        self._nodes = {}
+
+    def get_key(self, shape, threshold, plane, positive_to_negative):
+        """
+        Return the cache key for shape, reusing the key for unchanged meshes in the scene.
+        """
+        mesh = mesh_arrays.get_mesh(shape)
+        args = (threshold, plane, positive_to_negative)
+
+        node_keys = self._get_node_keys(mesh)
+        key = node_keys.get(args) if node_keys is not None else None
+        if key is None:
+            key = get_symmetry_map_key(mesh, *args)
+            if node_keys is not None:
+                node_keys[args] = key
+        return key
+
+    def lookup(self, key):
+        """
+        Return the cached map for key, or None if it isn't cached.
+        """
+        result = self._maps.pop(key, None)
+        if result is None:
+            result = self._load_spilled(key)
+        if result is None:
+            return None
+
+        self._maps[key] = result
+        self._evict()
+        return result
+
+    def store(self, key, result):
+        self._maps.pop(key, None)
+        self._maps[key] = result
+        self._evict()
+
+    def clear(self):
+        """
+        Clear the in-memory cache and stop watching nodes.  Spilled maps are left alone.
+        """
+        for handle, callbacks, node_keys in self._nodes.values():
+            callbacks.registered = False
+        self._nodes = {}
+        self._maps.clear()
+
+    def _get_node_keys(self, mesh):
+        """
+        Return the {args: key} dictionary for a mesh in the scene, watching it for changes if
+        we weren't already.  Return None if mesh isn't a scene mesh.
+        """
+        if not hasattr(mesh, 'get_handle'):
+            return None
+
+        handle = mesh.get_handle()
+        handle_hash = handle.hashCode()
+        entry = self._nodes.get(handle_hash)
+        if entry is not None:
+            old_handle, callbacks, node_keys = entry
+            if old_handle.isValid() and old_handle.object() == handle.object():
+                return node_keys
+
+            # The node this entry was for has been deleted.
+            callbacks.registered = False
+
+        node_keys = {}
+        callbacks = mesh.add_change_callbacks(lambda *args: node_keys.clear())
+        self._nodes[handle_hash] = (handle, callbacks, node_keys)
+        return node_keys
+
+    def _evict(self):
+        while len(self._maps) > self.max_entries:
+            key, result = self._maps.popitem(last=False)
+            self._spill(key, result)
+
+    def _get_spill_filename(self, key):
+        return os.path.join(self.spill_path, '%s.npz' % key)
+
+    def _spill(self, key, result):
+        if self.spill_path is None:
+            return
+
+        util.mkdir_p(self.spill_path)
+        np.savez(self._get_spill_filename(key), vertex_array=result.vertex_array, unmapped=result.unmapped)
+
+    def _load_spilled(self, key):
+        if self.spill_path is None:
+            return None
+
+        try:
+            with np.load(self._get_spill_filename(key)) as data:
+                return _SymmetryMapEntry(data['vertex_array'], data['unmapped'])
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+class _SymmetryMapEntry(object):
+    """
+    A symmetry map in array form, creating the dictionary form only if it's asked for.
+    """
+    def __init__(self, vertex_array, unmapped):
+        # These are shared by everyone using the cache, so don't let them be modified.
+        self.vertex_array = vertex_array
+        self.unmapped = unmapped
+        self.vertex_array.flags.writeable = False
+        self.unmapped.flags.writeable = False
+        self._dict_form = None
+
+    def get_arrays(self):
+        return self.vertex_array, self.unmapped
+
+    def get_dict_form(self):
+        """
+        Return (index_mapping, unmapped) as a dict and a set.
+
+        These are new copies each time, since callers have always been free to modify them.
+        Copying is still much faster than converting the arrays again.
+        """
+        if self._dict_form is None:
+            self._dict_form = vertex_array_to_map(self.vertex_array), set(self.unmapped.tolist())
+        index_mapping, unmapped = self._dict_form
+        return dict(index_mapping), set(unmapped)
+
+# The cache used by make_vertex_symmetry_map.
+symmetry_map_cache = SymmetryMapCache()
+
+def make_vertex_symmetry_map(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True, method='kdtree', cache=None, processes=None,
+        use_cache=True, axis_origin=0):
     """
     Given a shape, make a mapping from vertices on one side to matching vertices on the
     other side.
 
+    axis_of_symmetry and axis_origin give the plane of symmetry, as in get_symmetry_plane.
+    By default, this is the YZ plane through the origin.
+
+    method, cache and processes are passed to point_matching.match_points.
+
+    Results are cached in symmetry_map_cache unless use_cache is false.  The returned map
+    and set are copies, so they can be modified by the caller.
+
     Return a map of {dst: src} vertex indices and a list of target vertices that weren't matched.
     """
-    axes = {'x': 0, 'y': 1, 'z': 2}
-    axis_of_symmetry = axes[axis_of_symmetry]
-    
-    vertices = cmds.xform('%s.vtx[*]' % shape, q=True, ws=True, t=True)
-    vertices = [(x, y, z) for x, y, z in zip(vertices[0::3], vertices[1::3], vertices[2::3])]
-    vertices = [PointWithIndex(vtx, idx) for idx, vtx in enumerate(vertices)]
-
-    def is_destination_vertex(idx):
-        if positive_to_negative and p[axis_of_symmetry] >= -0.0001:
-            return False
-        if not positive_to_negative and p[axis_of_symmetry] <= +0.0001:
-            return False
-        return True
-
-    # Make a tree of the vertex positions.
-    tree = kdtree.create(vertices)
-
-    index_mapping = {}
-    unmapped_dst_vertices = set()
-    for dst_idx, p in enumerate(vertices):
-        # If this vertex is on the wrong side, skip it.
-        if not is_destination_vertex(dst_idx):
-            continue
-            
-        p = (-p[0], p[1], p[2])
-        node, distance = tree.search_nn(p)
-        src_idx = node.data.idx
-
-        if distance > threshold:
-            # We don't have a match.  Remember that this vertex was unmatched.
-            unmapped_dst_vertices.add(dst_idx)
+    return make_vertex_symmetry_maps(shape, [axis_of_symmetry], threshold, positive_to_negative, method=method,
+            cache=cache, processes=processes, use_cache=use_cache, axis_origins=[axis_origin])[0]
+
+def make_vertex_symmetry_array(shape, threshold=0.01, axis_of_symmetry='x', positive_to_negative=True, method='kdtree', cache=None, processes=None,
+        use_cache=True, axis_origin=0):
+    """
+    Make a symmetry map in array form.  This is the same as make_vertex_symmetry_map, but
+    returns (vertex_array, unmapped) arrays.  vertex_array has an entry for every vertex in
+    the shape, which is -1 for vertices that aren't on the destination side.
+
+    Cached arrays are read-only.
+    """
+    return make_vertex_symmetry_arrays(shape, [axis_of_symmetry], threshold, positive_to_negative, method=method,
+            cache=cache, processes=processes, use_cache=use_cache, axis_origins=[axis_origin])[0]
+
+def make_vertex_symmetry_maps(shape, axes=('x', 'y', 'z'), threshold=0.01, positive_to_negative=True, method='kdtree', cache=None, processes=None,
+        use_cache=True, axis_origins=None):
+    """
+    Make symmetry maps across several planes at once.
+
+    axes is a list of axis_of_symmetry values, and axis_origins is a matching list of
+    axis_origin values, defaulting to 0.  The vertices of all planes are matched together
+    against a single spatial index, which is faster than calling make_vertex_symmetry_map
+    for each.
+
+    The other arguments are the same as make_vertex_symmetry_map.  Return a list of
+    (index_mapping, unmapped_dst_vertices) results, one for each plane.
+    """
+    entries = _get_vertex_symmetry_entries(shape, axes, threshold, positive_to_negative, method, cache, processes, use_cache, axis_origins)
+    return [entry.get_dict_form() for entry in entries]
+
+def make_vertex_symmetry_arrays(shape, axes=('x', 'y', 'z'), threshold=0.01, positive_to_negative=True, method='kdtree', cache=None, processes=None,
+        use_cache=True, axis_origins=None):
+    """
+    The array form of make_vertex_symmetry_maps, returning a list of (vertex_array, unmapped)
+    arrays like make_vertex_symmetry_array.
+    """
+    entries = _get_vertex_symmetry_entries(shape, axes, threshold, positive_to_negative, method, cache, processes, use_cache, axis_origins)
+    return [entry.get_arrays() for entry in entries]
+
+def _get_vertex_symmetry_entries(shape, axes, threshold, positive_to_negative, method, cache, processes, use_cache, axis_origins):
+    if axis_origins is None:
+        axis_origins = [0] * len(axes)
+    if len(axis_origins) != len(axes):
+        raise ValueError('axis_origins must have an entry for each axis')
+    planes = [get_symmetry_plane(axis, origin) for axis, origin in zip(axes, axis_origins)]
+
+    mesh = mesh_arrays.get_mesh(shape)
+    results = [None] * len(planes)
+    keys = [None] * len(planes)
+    if use_cache:
+        for idx, plane in enumerate(planes):
+            keys[idx] = symmetry_map_cache.get_key(mesh, threshold, plane, positive_to_negative)
+            results[idx] = symmetry_map_cache.lookup(keys[idx])
+
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        new_results = _make_vertex_symmetry_arrays(mesh, [planes[idx] for idx in missing],
+                threshold, positive_to_negative, method, cache, processes)
+        for idx, (vertex_array, unmapped) in zip(missing, new_results):
+            results[idx] = _SymmetryMapEntry(vertex_array, unmapped)
+            if use_cache:
+                symmetry_map_cache.store(keys[idx], results[idx])
+
+    return results
+
+def _make_vertex_symmetry_arrays(shape, planes, threshold, positive_to_negative, method, cache, processes):
+    vertices = _get_vertices(shape)
+
+    # Find vertices on the destination side of each plane, and the mirrored position of each.
+    plane_dst_indices = []
+    plane_mirrored = []
+    for plane in planes:
+        mirrored, side = _mirror_points(vertices, plane)
+        if positive_to_negative:
+            dst_indices = np.flatnonzero(side < -0.0001)
         else:
-            index_mapping[dst_idx] = src_idx
-            
+            dst_indices = np.flatnonzero(side > +0.0001)
+        plane_dst_indices.append(dst_indices)
+        plane_mirrored.append(mirrored[dst_indices])
+
+    # Search for all of the mirrored positions in one pass.
+    src_indices, distances = point_matching.match_points(vertices, np.concatenate(plane_mirrored), threshold,
+            method=method, cache=cache, processes=processes)
+
+    results = []
+    start = 0
+    for dst_indices in plane_dst_indices:
+        plane_src_indices = src_indices[start:start+len(dst_indices)]
+        start += len(dst_indices)
+
+        # Remember which vertices didn't have a match.
+        vertex_array = np.full(len(vertices), -1, dtype=np.int32)
+        vertex_array[dst_indices] = plane_src_indices
+        unmapped = dst_indices[plane_src_indices == -1].astype(np.int32)
+        results.append((vertex_array, unmapped))
+
+    return results
+
+def make_topological_vertex_symmetry_map(shape, seam_edge=None, vertex_pair=None, axis_of_symmetry='x', positive_to_negative=True, axis_origin=0):
+    """
+    Given a shape, make a mapping from vertices on one side to matching vertices on the
+    other side using its topology instead of vertex positions, so it works on posed
+    or slightly asymmetric meshes.
+
+    seam_edge or vertex_pair gives the symmetry, as in mesh_topology.make_topological_symmetry_map.
+    Each pair of mirrored vertices is split into source and destination by position, using
+    axis_of_symmetry, axis_origin and positive_to_negative like make_vertex_symmetry_map.
+
+    Return a map of {dst: src} vertex indices and a list of target vertices that weren't matched.
+    Raise ValueError if the mesh isn't topologically symmetric.
+    """
+    plane = get_symmetry_plane(axis_of_symmetry, axis_origin)
+
+    mesh = mesh_arrays.get_mesh(shape)
+    vertices = _get_vertices(mesh)
+    face_counts, face_connects = mesh.get_face_vertices()
+    mirror = mesh_topology.make_topological_symmetry_map(face_counts, face_connects,
+            seam_edge=seam_edge, vertex_pair=vertex_pair, vertex_count=len(vertices))
+
+    # Of each mirrored pair, the destination is the vertex further towards the destination side.
+    mirrored, side = _mirror_points(vertices, plane)
+    if not positive_to_negative:
+        side = -side
+    indices = np.arange(len(vertices))
+    matched = np.flatnonzero((mirror != -1) & (mirror != indices))
+    is_dst = side[matched] < side[mirror[matched]]
+    dst_indices = matched[is_dst]
+    index_mapping = dict(zip(dst_indices.tolist(), mirror[dst_indices].tolist()))
+
+    # Vertices that weren't reached are unmatched if they're on the destination side.
+    unmapped_dst_vertices = set(np.flatnonzero((mirror == -1) & (side < -0.0001)).tolist())
     return index_mapping, unmapped_dst_vertices
-    
-def make_vertex_map(src_shape, dst_shape, threshold=0.01):
+
+def make_vertex_map(src_shape, dst_shape, threshold=0.01, method='kdtree', cache=None, processes=None):
     """
     Given two shape, make a mapping from vertices on the first shape to matching vertices
     on the second shape.  Unmatched vertices will be mapped to -1.
+
+    method, cache and processes are passed to point_matching.match_points.
     
     Return a map of {dst: src} vertex indices and a list of vertices that weren't matched.
     """
-    shapes = (src_shape, dst_shape)
-    shape_vertices = []
-    for shape in shapes:
-        vertices = cmds.xform('%s.vtx[*]' % shape, q=True, ws=True, t=True)
-        vertices = [(x, y, z) for x, y, z in zip(vertices[0::3], vertices[1::3], vertices[2::3])]
-        vertices = [PointWithIndex(vtx, idx) for idx, vtx in enumerate(vertices)]
-        shape_vertices.append(vertices)
-
-    # Make a tree of the vertex positions in the first (source) shape.
-    src_tree = kdtree.create(shape_vertices[0])
-
-    index_mapping = {}
-    unmapped_dst_vertices = set()
-    for dst_vtx in shape_vertices[1]:
-        node, distance = src_tree.search_nn(dst_vtx)
-
-        src_idx = node.data.idx
-        dst_idx = dst_vtx.idx
-        if distance > threshold:
-            # We don't have a match.  Remember that this vertex was unmatched.
-            unmapped_dst_vertices.add(dst_idx)
-            index_mapping[dst_idx] = -1
-        else:
-            index_mapping[dst_idx] = src_idx
-            
+    vertex_array, unmapped = make_vertex_map_array(src_shape, dst_shape, threshold, method=method, cache=cache, processes=processes)
+    index_mapping = dict(enumerate(vertex_array.tolist()))
+    unmapped_dst_vertices = set(unmapped.tolist())
     return index_mapping, unmapped_dst_vertices
-    
 
+def make_vertex_map_array(src_shape, dst_shape, threshold=0.01, method='kdtree', cache=None, processes=None):
+    """
+    The array form of make_vertex_map.
+
+    Return (vertex_array, unmapped).  vertex_array has the source vertex of each destination
+    vertex, or -1 if it wasn't matched, and unmapped is the unmatched destination vertices.
+    """
+    src_vertices = _get_vertices(src_shape)
+    dst_vertices = _get_vertices(dst_shape)
+
+    # Search for every destination vertex in the source shape.
+    src_indices, distances = point_matching.match_points(src_vertices, dst_vertices, threshold,
+            method=method, cache=cache, processes=processes)
+    vertex_array = src_indices.astype(np.int32)
+    unmapped = np.flatnonzero(vertex_array == -1).astype(np.int32)
+    return vertex_array, unmapped
+
+class SurfaceMap(object):
+    """
+    The closest point on a source surface for each vertex of a destination mesh, from
+    make_surface_map.
+
+    - triangles: the source triangle of each destination vertex, or -1 if it wasn't matched
+    - faces: the source face of each destination vertex, or -1
+    - vertices: the (N,3) source vertex indices of each triangle
+    - barycentrics: the (N,3) weights of those vertices
+    - distances: the squared distance to the surface
+
+    The same map can be used to transfer any number of per-vertex values, such as skin
+    weights or blend shape deltas, between the same meshes.
+    """
+    def __init__(self, triangles, faces, vertices, barycentrics, distances):
+        self.triangles = triangles
+        self.faces = faces
+        self.vertices = vertices
+        self.barycentrics = barycentrics
+        self.distances = distances
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def matched(self):
+        return self.triangles != -1
+
+    def transfer(self, values, default=0):
+        """
+        Interpolate per-vertex values on the source mesh onto the destination vertices.
+
+        values is an array with a row for each source vertex, such as an (N,) array of
+        weights or an (N,C) array of several channels.  Unmatched destination vertices
+        get default.
+        """
+        values = np.asarray(values)
+        result = np.einsum('ij,ij...->i...', self.barycentrics, values[self.vertices])
+        result[~self.matched] = default
+        return result
+
+def make_surface_map(src_shape, dst_shape, max_distance=None):
+    """
+    Find the closest point on the surface of src_shape to each vertex of dst_shape.  This
+    works between meshes with different topology.
+
+    If max_distance is given, vertices further than this squared distance from the
+    surface aren't matched.
+
+    Return a SurfaceMap.
+    """
+    src_mesh = mesh_arrays.get_mesh(src_shape)
+    src_vertices = _get_vertices(src_mesh)
+    dst_vertices = _get_vertices(dst_shape)
+
+    face_counts, face_connects = src_mesh.get_face_vertices()
+    triangles, triangle_faces = mesh_topology.triangulate(face_counts, face_connects)
+    bvh = triangle_bvh.TriangleBVH(src_vertices, triangles)
+    tri, barycentrics, distances = bvh.query(dst_vertices, max_distance=max_distance)
+
+    # Only look up matched triangles.  If the source mesh has no faces, nothing is matched
+    # and there are no triangles to index.
+    matched = tri != -1
+    faces = np.full(len(tri), -1, dtype=triangle_faces.dtype)
+    faces[matched] = triangle_faces[tri[matched]]
+    vertices = np.zeros((len(tri), 3), dtype=triangles.dtype)
+    vertices[matched] = triangles[tri[matched]]
+    return SurfaceMap(tri, faces, vertices, barycentrics, distances)
+
+def interpolate_vertex_values(src_shape, dst_shape, values, k=4, radius=None, power=2, default=0, cache=None):
+    """
+    Transfer per-vertex values, such as weights, colors or blend shape deltas, from the
+    vertices of src_shape to dst_shape by inverse distance weighting.
+
+    The arguments are the same as point_matching.interpolate_values.
+    """
+    return point_matching.interpolate_values(_get_vertices(src_shape), values, _get_vertices(dst_shape),
+            k=k, radius=radius, power=power, default=default, cache=cache)